@@ -8,9 +8,10 @@ import socketio
 import wave
 from typing import List
 import whisper
-import aiohttp
 from openai import OpenAI  # For cloud fallback; optional
 
+from llm_client import LLMClient
+
 # Config (reuse from your swarm)
 SERVER_URL = os.getenv("SERVER_URL", "http://localhost:5000")
 LM_API = os.getenv("LM_API", "http://localhost:1234/v1/chat/completions")
@@ -24,6 +25,9 @@ FORMAT = pyaudio.paInt16
 # Load Whisper model (local, offline)
 whisper_model = whisper.load_model(WHISPER_MODEL_SIZE)
 
+# Pooled keep-alive connections to the LLM, shared by every transcript
+llm = LLMClient.from_env(LM_API)
+
 # Socket.IO client for swarm integration
 sio = socketio.AsyncClient()
 
@@ -93,7 +97,7 @@ async def transcribe_audio(audio_bytes: bytes) -> str:
             print(f"Cloud Whisper failed: {e}")
     return ""
 
-async def generate_llm_reaction(transcript: str, session: aiohttp.ClientSession) -> str:
+async def generate_llm_reaction(transcript: str) -> str:
     """Generate Twitch-style reaction via your local LLM."""
     if not transcript:
         return ""
@@ -111,15 +115,12 @@ Reply with ONE short, hype/sarcastic/emote-filled message (under 20 words). Stay
     }
     
     try:
-        async with session.post(LM_API, json=payload) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                reply = data["choices"][0]["message"]["content"].strip()
-                # Clean: Remove quotes/newlines, add random emote if possible
-                reply = reply.replace('\n', ' ').strip('"\'`')
-                if random.random() < 0.5:
-                    reply += f" {random.choice(['PogChamp', 'KEKW', 'LUL'])}"
-                return reply
+        reply = await llm.complete(payload)
+        # Clean: Remove quotes/newlines, add random emote if possible
+        reply = reply.replace('\n', ' ').strip('"\'`')
+        if random.random() < 0.5:
+            reply += f" {random.choice(['PogChamp', 'KEKW', 'LUL'])}"
+        return reply
     except Exception as e:
         print(f"LLM reaction failed: {e}")
         # Fallback: Simple reaction
@@ -149,16 +150,16 @@ async def audio_capture_loop():
                 print(f"[TRANSCRIPT] {transcript}")
                 
                 # LLM reaction
-                async with aiohttp.ClientSession() as session:
-                    reaction = await generate_llm_reaction(transcript, session)
-                    if reaction:
-                        await send_reaction_to_chat(reaction)
+                reaction = await generate_llm_reaction(transcript)
+                if reaction:
+                    await send_reaction_to_chat(reaction)
     except KeyboardInterrupt:
         print("Stopping audio capture...")
     finally:
         stream.stop_stream()
         stream.close()
         p.terminate()
+        await llm.close()
 
 async def main():
     # Connect to swarm
@@ -1,15 +1,28 @@
+import argparse
 import asyncio
 import json
+import multiprocessing
 import os
+import queue
 import random
 import re
+import signal
+import sys
 import time
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import aiohttp
+from aiohttp import web
 from faker import Faker
 import socketio
 
+from llm_cache import ResponseCache, context_key
+from llm_client import LLMClient, LLMError
+from llm_scheduler import CHATTER, MENTION, REPLY, Expired, LLMScheduler, Overloaded
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, SIZE_BUCKETS, SLOW_BUCKETS
+from prompt_batcher import PromptBatcher
+
 # ----------------------------------------------------------------------
 # CONFIG
 # ----------------------------------------------------------------------
@@ -17,14 +30,50 @@ SERVER_URL = os.getenv("SERVER_URL", "http://localhost:5000")
 LM_API     = os.getenv("LM_API", "http://localhost:1234/v1/chat/completions")
 MODEL      = os.getenv("LM_MODEL", "lmstudio-community/Meta-Llama-3-8B-Instruct")
 
-ROOM_ID    = "test-room-123"
-# NUM_BOTS: prefer explicit env override, but we'll enforce one-bot-per-persona below
+ROOM_ID    = os.getenv("ROOM_ID", "test-room-123")
+# Comma-separated rooms to populate, and bots per room (0 = one per persona)
+SWARM_ROOMS = [room.strip() for room in (os.getenv("SWARM_ROOMS") or ROOM_ID).split(",") if room.strip()]
+BOTS_PER_ROOM = int(os.getenv("BOTS_PER_ROOM", "0"))
+# Worker processes, each running its share of rooms on its own event loop (0 = one per core)
+SWARM_WORKERS = int(os.getenv("SWARM_WORKERS", "1"))
+# NUM_BOTS: superseded by BOTS_PER_ROOM; only used for the startup note below
 NUM_BOTS   = int(os.getenv("NUM_BOTS", "22"))
 MAX_TOKENS = 60
 TEMPERATURE = 0.85
+# Send each bot's persona as a system message instead of inlining it in the user turn
+LLM_SYSTEM_PROMPT = os.getenv("LLM_SYSTEM_PROMPT", "0").lower() in ("1", "true", "yes")
 
 fake = Faker()
 
+# One pooled keep-alive client per process for every bot's completions
+llm = LLMClient.from_env(LM_API)
+# ...and one queue in front of it, so a burst of replies can't swamp the LM server
+scheduler = LLMScheduler.from_env()
+# Completions for near-identical chat, per persona
+response_cache = ResponseCache.from_env()
+
+# Prometheus-format metrics served on BOT_METRICS_PORT/metrics (0 = off)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9101"))
+metrics = Registry(prefix="swarm_")
+llm_seconds = metrics.histogram("llm_request_seconds", "LLM call latency in seconds",
+	labels=("outcome",), buckets=SLOW_BUCKETS)
+fallback_replies = metrics.counter("fallback_replies_total",
+	"Replies generated locally because the LLM call failed")
+messages_sent = metrics.counter("messages_sent_total", "Chat messages sent by bots")
+llm_queue_seconds = metrics.histogram("llm_queue_seconds",
+	"Time LLM requests waited for a scheduler slot", buckets=SLOW_BUCKETS)
+llm_shed = metrics.counter("llm_shed_total",
+	"LLM requests the scheduler refused (overloaded) or dropped as too late (expired)", labels=("reason",))
+llm_batch_size = metrics.histogram("llm_batch_size",
+	"Bots served by one batched LLM request", buckets=SIZE_BUCKETS)
+llm_cache_lookups = metrics.counter("llm_cache_lookups_total",
+	"Response cache lookups by result", labels=("result",))
+metrics.gauge("llm_cache_entries", "Chat contexts in the response cache", lambda: len(response_cache.entries))
+metrics.gauge("llm_in_flight", "LLM requests holding a scheduler slot", lambda: scheduler.active)
+metrics.gauge("llm_queue_depth", "LLM requests waiting for a scheduler slot", lambda: len(scheduler.waiting))
+metrics.gauge("bots_connected", "Bots with a live Socket.IO connection",
+	lambda: sum(1 for b in bots if b.bot_sio and b.bot_sio.connected))
+
 PERSONAS = [
 		{
 				"name": "sarcastic weeb",
@@ -312,11 +361,162 @@ def _load_fallback_emotes():
 				"GIGACHAD": "20", "Clueless": "21", "Copium": "22", "Susge": "23"
 		}
 
+# ----------------------------------------------------------------------
+# LLM CALLS
+# ----------------------------------------------------------------------
+PROMPT_INSTRUCTIONS = ("You are a Twitch chatter. Reply to the chat with ONE short message (max 10 words) "
+	"that reflects YOUR UNIQUE personality. Stay in character!")
+
+PERSONA_EXAMPLES = {
+	"hype beast": ["YOOO THIS IS INSANE", "LETS GOOOOO", "NO SHOT BRO"],
+	"toxic troll": ["cope harder", "L + ratio", "skill issue lmao"],
+	"wholesome supporter": ["love this energy", "youre doing amazing", "so wholesome"],
+	"coomer": ["down bad rn", "BOOBA", "mommy sorry mommy"],
+	"pepega viewer": ["wait what happened", "i dont get it", "someone explain?"],
+	"meme lord": ["POV: you said that", "this is the way", "always has been"],
+	"backseat gamer": ["shouldve done X", "why didnt you", "just press the button"],
+	"gigachad": ["objectively wrong", "factually based", "and im right"],
+	"anime analyst": ["S tier take", "mid opinion", "overrated honestly"],
+	"sarcastic weeb": ["imagine saying that", "peak fiction fr", "unironically based"],
+}
+
+# Batched requests share PROMPT_INSTRUCTIONS as their prefix, then this
+BATCH_INSTRUCTIONS = ("This time you write for several chatters at once. For EACH numbered chatter "
+	"below, write ONE message in THAT chatter's personality. Answer with exactly one line per chatter, "
+	"formatted as \"number: message\", and nothing else.")
+
+def persona_lines(persona: dict) -> List[str]:
+	"""A persona's description block, as it appears in every prompt."""
+	lines = [
+		f"Persona: {persona['desc']}",
+		f"Communication style: {' '.join(persona['style'])}",
+		f"Your signature phrases: {', '.join(persona['phrases'])}",
+		f"Topics you care about: {', '.join(persona['favorite_topics'])}",
+	]
+	examples = PERSONA_EXAMPLES.get(persona["name"])
+	if examples:
+		lines += ["", f"Examples for YOUR persona ({persona['name']}):"]
+		lines += [f"- '{example}'" for example in examples]
+	return lines
+
+def persona_prompt(persona: dict, name: str) -> str:
+	"""The fixed part of a bot's prompt, most widely shared text first.
+
+	Instructions are the same for every bot and the persona block for every bot
+	with that persona; only the last line is per bot. Keeping the recent chat
+	after all of it lets the LM server's prefix cache skip re-reading it.
+	"""
+	lines = [PROMPT_INSTRUCTIONS, ""] + persona_lines(persona)
+	lines += ["", f"Your name in chat is {name}."]
+	return "\n".join(lines)
+
+async def complete(messages: List[dict], queued: float, who: str, max_tokens: int = MAX_TOKENS) -> Optional[str]:
+	"""One chat completion once the scheduler has given us a slot; None if it failed."""
+	started = time.perf_counter()
+	llm_queue_seconds.observe(started - queued)
+	outcome = "error"
+	try:
+		payload = {
+			"model": MODEL,
+			"messages": messages,
+			"temperature": TEMPERATURE,
+			"max_tokens": max_tokens
+		}
+		reply = await llm.complete(payload)
+		llm_seconds.observe(time.perf_counter() - started, "ok")
+		return reply
+	except LLMError as e:
+		outcome = "http_error"
+		print(f"LM call failed for {who}: {e}")
+	except Exception as e:
+		print(f"LM call failed for {who}: {e}")
+	llm_seconds.observe(time.perf_counter() - started, outcome)
+	return None
+
+def batch_prompt_messages(chat_context: str, members: list) -> List[dict]:
+	"""Chat messages for one completion that asks every bot in members for a reply.
+
+	Laid out like ChatBot.prompt_messages: the shared instructions first, then
+	each member's persona block, the chat last (and LLM_SYSTEM_PROMPT splits
+	them the same way), so batched calls reuse the LM server's prefix cache.
+	"""
+	lines = [PROMPT_INSTRUCTIONS, BATCH_INSTRUCTIONS]
+	for number, bot in enumerate(members, 1):
+		lines += ["", f"Chatter {number}, named {bot.name}:"] + persona_lines(bot.persona)
+	prefix = "\n".join(lines)
+	turn = f"Recent chat:\n{chat_context}\n\nYour lines:"
+	if LLM_SYSTEM_PROMPT:
+		return [{"role": "system", "content": prefix}, {"role": "user", "content": turn}]
+	return [{"role": "user", "content": f"{prefix}\n\n{turn}"}]
+
+_BATCH_LINE = re.compile(r"^\W*(\d+)\s*[.:)\]]\s*(.*)$")
+
+def split_batch_reply(text: str, members: list) -> dict:
+	"""Map each member's index to its line of a batched reply.
+
+	Lines are keyed by chatter number, so two bots with the same name still
+	get their own lines.
+	"""
+	replies = {}
+	for line in text.splitlines():
+		match = _BATCH_LINE.match(line.strip())
+		if not match:
+			continue
+		index = int(match.group(1)) - 1
+		reply = match.group(2).strip()
+		if not 0 <= index < len(members) or index in replies:
+			continue
+		# "1: name: message" -> "message"
+		name, sep, rest = reply.partition(":")
+		if sep and name.strip(" *\"'`").lower() == members[index].name.lower():
+			reply = rest.strip()
+		if reply:
+			replies[index] = reply
+	return replies
+
+async def flush_prompts(key, requests: list) -> list:
+	"""PromptBatcher flush: [(bot, messages, priority, deadline, cache_key)] -> one reply (or None) per bot."""
+	if len(requests) == 1:
+		return [await requests[0][0]._call_lm(*requests[0][1:])]
+
+	members = [r[0] for r in requests]
+	llm_batch_size.observe(len(members))
+	queued = time.perf_counter()
+	messages = batch_prompt_messages(key[1], members)
+	who = f"batch of {len(members)} in {key[0]}"
+	try:
+		# the batch is as urgent as its most urgent member, and useful until the last deadline
+		text = await scheduler.run(lambda: complete(messages, queued, who, MAX_TOKENS * len(members)),
+			min(r[2] for r in requests), max(r[3] for r in requests))
+	except Overloaded:
+		llm_shed.inc("overloaded")
+		text = None
+	except Expired:
+		llm_shed.inc("expired")
+		return [None] * len(members)
+
+	replies = split_batch_reply(text, members) if text else {}
+	results = []
+	for index, (bot, _, _, _, cache_key) in enumerate(requests):
+		reply = replies.get(index)
+		if reply is None:
+			fallback_replies.inc()
+			reply = bot._generate_fallback()
+		elif cache_key is not None:
+			response_cache.put(cache_key, reply, time.time())
+		results.append(reply)
+	return results
+
+prompt_batcher = PromptBatcher(flush_prompts,
+	window=float(os.getenv("LLM_BATCH_WINDOW_MS", "750")) / 1000,
+	max_batch=int(os.getenv("LLM_BATCH_MAX", "8")))
+
 # ----------------------------------------------------------------------
 class ChatBot:
-		def __init__(self, sid: str, name: str, persona: dict):
+		def __init__(self, sid: str, name: str, persona: dict, room: str):
 				self.sid = sid
 				self.name = name
+				self.room = room
 				self.persona = persona
 				self.persona_name = persona["name"]
 				self.persona_desc = persona["desc"]
@@ -384,25 +584,38 @@ class ChatBot:
 				self.engaged_in_topic = False
 				self.topic_engagement_count = 0
 
-		async def _call_lm(self, prompt: str) -> str:
+				# Only the recent chat changes between calls, so the rest is built once
+				self.prompt_prefix = persona_prompt(persona, name)
+
+		def prompt_messages(self, chat_context: str) -> List[dict]:
+				"""Chat messages for one completion: the precompiled prefix, then the chat."""
+				turn = f"Recent chat:\n{chat_context}\n\nYour response:"
+				if LLM_SYSTEM_PROMPT:
+						return [{"role": "system", "content": self.prompt_prefix}, {"role": "user", "content": turn}]
+				return [{"role": "user", "content": f"{self.prompt_prefix}\n\n{turn}"}]
+
+		async def _call_lm(self, messages: List[dict], priority: int = CHATTER, deadline: Optional[float] = None,
+				cache_key=None) -> Optional[str]:
+				"""Reply text via the swarm-wide scheduler; None if it would arrive too late.
+
+				A reply that came from the LM is added to the response cache under cache_key.
+				"""
+				queued = time.perf_counter()
 				try:
-						payload = {
-								"model": MODEL,
-								"messages": [{"role": "user", "content": prompt}],
-								"temperature": TEMPERATURE,
-								"max_tokens": MAX_TOKENS
-						}
-						async with aiohttp.ClientSession() as session:
-								async with session.post(LM_API, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-										if resp.status == 200:
-												data = await resp.json()
-												reply = data["choices"][0]["message"]["content"].strip()
-												return reply
-				except Exception as e:
-						print(f"LM call failed for {self.name}: {e}")
-				
-				# Fallback responses
-				return self._generate_fallback()
+						reply = await scheduler.run(lambda: complete(messages, queued, self.name), priority, deadline)
+				except Overloaded:
+						llm_shed.inc("overloaded")
+						reply = None
+				except Expired:
+						llm_shed.inc("expired")
+						return None
+				if reply is None:
+						fallback_replies.inc()
+						# Fallback responses
+						return self._generate_fallback()
+				if cache_key is not None:
+						response_cache.put(cache_key, reply, time.time())
+				return reply
 
 		def _generate_fallback(self):
 				"""Generate realistic Twitch-style responses based on persona"""
@@ -468,11 +681,12 @@ class ChatBot:
 			self.last_msg_time = time.time()
 			print(f"{self.name} → {text}")
 			if self.bot_sio and self.bot_sio.connected:
+				messages_sent.inc()
 				# Mark messages coming from bots so others can ignore bot-to-bot replies
 				await self.bot_sio.emit("bot_message", {
 					"user": self.name,
 					"text": text,
-					"room": ROOM_ID,
+					"room": self.room,
 					"is_bot": True
 				})
 
@@ -713,52 +927,37 @@ class ChatBot:
 								await self.send(random.choice(["lol", "lmao", "true", "real"]))
 						return
 				
-				# Build context for LM with persona emphasis
+				# The recent chat is the only part of the prompt built per call
 				chat_context = "\n".join(f"{m['user']}: {m['text']}" for m in recent)
 				
-				# Persona-specific prompt enhancements
-				style_notes = " ".join(self.persona_style)
-				
-				prompt = f"""You are {self.name}, a Twitch chatter.
-Persona: {self.persona_desc}
-Communication style: {style_notes}
-Your signature phrases: {', '.join(self.persona_phrases)}
-Topics you care about: {', '.join(self.persona_topics)}
-
-Recent chat:
-{chat_context}
+				messages = self.prompt_messages(chat_context)
 
-Reply with ONE short message (max 10 words) that reflects YOUR UNIQUE personality. Stay in character!
-
-Examples for YOUR persona ({self.persona_name}):
-"""
-				
-				# Add persona-specific examples
-				if self.persona_name == "hype beast":
-						prompt += "- 'YOOO THIS IS INSANE'\n- 'LETS GOOOOO'\n- 'NO SHOT BRO'"
-				elif self.persona_name == "toxic troll":
-						prompt += "- 'cope harder'\n- 'L + ratio'\n- 'skill issue lmao'"
-				elif self.persona_name == "wholesome supporter":
-						prompt += "- 'love this energy'\n- 'youre doing amazing'\n- 'so wholesome'"
-				elif self.persona_name == "coomer":
-						prompt += "- 'down bad rn'\n- 'BOOBA'\n- 'mommy sorry mommy'"
-				elif self.persona_name == "pepega viewer":
-						prompt += "- 'wait what happened'\n- 'i dont get it'\n- 'someone explain?'"
-				elif self.persona_name == "meme lord":
-						prompt += "- 'POV: you said that'\n- 'this is the way'\n- 'always has been'"
-				elif self.persona_name == "backseat gamer":
-						prompt += "- 'shouldve done X'\n- 'why didnt you'\n- 'just press the button'"
-				elif self.persona_name == "gigachad":
-						prompt += "- 'objectively wrong'\n- 'factually based'\n- 'and im right'"
-				elif self.persona_name == "anime analyst":
-						prompt += "- 'S tier take'\n- 'mid opinion'\n- 'overrated honestly'"
-				elif self.persona_name == "sarcastic weeb":
-						prompt += "- 'imagine saying that'\n- 'peak fiction fr'\n- 'unironically based'"
-				
-				prompt += "\n\nYour response:"
+				# Near-duplicate chat (emote storms, "real" chains) is answered from the cache
+				reply = None
+				cache_key = None
+				if response_cache.enabled:
+						cache_key = (self.persona_name, context_key(m["text"] for m in recent))
+						reply = response_cache.get(cache_key, time.time())
+						llm_cache_lookups.inc("miss" if reply is None else "hit")
 
 				# Try LM, fallback to template
-				reply = await self._call_lm(prompt)
+				if reply is None:
+						# Mentions jump the LLM queue, then questions and threads the bot is in
+						if self.name.lower() in last_msg["text"].lower():
+								priority = MENTION
+						elif "?" in last_msg["text"] or self.engaged_in_topic:
+								priority = REPLY
+						else:
+								priority = CHATTER
+						deadline = last_msg.get("at", time.time()) + scheduler.deadline
+						request = (self, messages, priority, deadline, cache_key)
+						if prompt_batcher.enabled:
+								# Bots answering the same chat within the window share one request
+								reply = await prompt_batcher.submit((self.room, chat_context), request)
+						else:
+								reply = await self._call_lm(*request[1:])
+						if reply is None:
+								return  # chat has moved on
 				
 				# Clean up LM response (remove quotes, newlines, etc)
 				reply = re.sub(r'^["\'`]|["\'`]$', '', reply)
@@ -794,19 +993,30 @@ Examples for YOUR persona ({self.persona_name}):
 # -----------------------------------------------------------------------
 # Global state and spawn logic
 # -----------------------------------------------------------------------
-room_messages: List[dict] = []
+room_messages: Dict[str, List[dict]] = {}  # room -> recent chat, shared by its bots
+# room -> ids already in (or aged out of) room_messages, oldest first. Every bot in
+# the room receives each message, possibly far apart, so this reaches back well
+# past the 50-message history and a full server batch.
+room_seen_ids: Dict[str, "OrderedDict[str, None]"] = {}
+SEEN_IDS_MAX = 500
 bots: List[ChatBot] = []
 
 
-async def spawn_bot(idx: int, persona: dict | None = None):
-		"""Spawn a single bot. If persona is provided, use it; otherwise pick randomly."""
+def room_bots(room: str) -> List[ChatBot]:
+		return [b for b in bots if b.room == room]
+
+
+async def spawn_bot(idx: int, room: str, persona: dict | None = None):
+		"""Spawn a single bot in room. If persona is provided, use it; otherwise pick randomly."""
 		name = f"{fake.first_name()}{random.randint(10,999)}"
 		sid = f"bot_{idx}_{int(time.time())}"
 		if persona is None:
 			persona = random.choice(PERSONAS)
 
-		bot = ChatBot(sid, name, persona)
+		bot = ChatBot(sid, name, persona, room)
 		bots.append(bot)
+		history = room_messages.setdefault(room, [])
+		seen_ids = room_seen_ids.setdefault(room, OrderedDict())
 
 		bot_sio: socketio.AsyncClient = socketio.AsyncClient()
 		bot.bot_sio = bot_sio
@@ -816,50 +1026,88 @@ async def spawn_bot(idx: int, persona: dict | None = None):
 			print(f"{name} connected as: {persona['name']}")
 			# emit initial session info and join room once
 			await bot_sio.emit("start", {"sid": sid, "system": f"You are {persona['desc']}"})
-			await bot_sio.emit("join", {"room": ROOM_ID, "user": name})
+			await bot_sio.emit("join", {"room": room, "user": name})
 
 		@bot_sio.event
 		async def disconnect():
 			print(f"{name} disconnected")
 
-		@bot_sio.on("message")  # type: ignore
-		async def on_message(data):
+		@bot_sio.on("emotes_delta")  # type: ignore
+		async def on_emotes_delta(data):
+			# The server hot-reloaded emotes.json; every bot sees this, applying it is idempotent
+			SEVENTV_EMOTES.update(data.get("added", {}))
+			for emote in data.get("removed", []):
+				SEVENTV_EMOTES.pop(emote, None)
+
+		def remember(data):
+			# Every bot in the room receives the message; record it once
+			msg_id = data.get("id")
+			if msg_id is not None:
+				if msg_id in seen_ids:
+					return
+				seen_ids[msg_id] = None
+				if len(seen_ids) > SEEN_IDS_MAX:
+					seen_ids.popitem(last=False)
 			# Preserve is_bot flag if present so bots can ignore bot-originated messages
-			msg = {"user": data["user"], "text": data["text"], "is_bot": data.get("is_bot", False)}
-			room_messages.append(msg)
+			msg = {"id": msg_id, "user": data["user"], "text": data["text"], "is_bot": data.get("is_bot", False),
+				"at": time.time()}
+			history.append(msg)
 
 			# Keep last 50 messages
-			if len(room_messages) > 50:
-				room_messages.pop(0)
+			if len(history) > 50:
+				history.pop(0)
 
+		@bot_sio.on("message")  # type: ignore
+		async def on_message(data):
+			remember(data)
+			await respond(data)
+
+		@bot_sio.on("messages")  # type: ignore
+		async def on_messages(data):
+			# Micro-batched frame: record every message, then react once to the last
+			batch = data.get("messages") or []
+			for item in batch:
+				remember(item)
+			if batch:
+				await respond(batch[-1])
+
+		async def respond(data):
 			# Smart response logic
-			if not bot.should_respond(room_messages):
+			if not bot.should_respond(history):
 				return
 
 			# Show typing indicator
-			await bot_sio.emit("typing", {"room": ROOM_ID, "user": bot.name})
+			await bot_sio.emit("typing", {"room": room, "user": bot.name})
 
 			# Realistic typing delay (reading + typing time)
 			read_time = len(data["text"]) * 0.03  # Time to read message
 			type_time = random.uniform(bot.speed * 0.5, bot.speed * 1.5)
 			await asyncio.sleep(read_time + type_time)
 
-			await bot.think_and_reply(room_messages)
-			await bot_sio.emit("stop_typing", {"room": ROOM_ID, "user": bot.name})
+			await bot.think_and_reply(history)
+			await bot_sio.emit("stop_typing", {"room": room, "user": bot.name})
+
+		async def keepalive():
+			# Lurkers can stay quiet for a long time; don't get reaped as idle
+			while True:
+				await asyncio.sleep(60)
+				if bot_sio.connected:
+					await bot_sio.emit("ping")
 
 		try:
 			# Connect; the connect handler will perform the start/join emits
+			asyncio.create_task(keepalive())
 			await bot_sio.connect(SERVER_URL)
 			print(f"Bot {name} spawned (persona={persona['name']})")
 			await bot_sio.wait()
 		except Exception as e:
 			print(f"Bot {name} error: {e}")
 
-async def seed_conversation():
+async def seed_conversation(room: str):
 		"""Start initial conversation"""
 		await asyncio.sleep(5)
-		if bots:
-				starter = random.choice(bots)
+		if room_bots(room):
+				starter = random.choice(room_bots(room))
 				starters = [
 						"yo whats good", "anyone here?", "dead chat", "first KEKW",
 						"hi chat", "what we watchin", "poggers stream", "lets goooo"
@@ -869,17 +1117,18 @@ async def seed_conversation():
 						msg += f" {random.choice(list(SEVENTV_EMOTES.keys()))}"
 				await starter.send(msg)
 
-async def periodic_activity():
+async def periodic_activity(room: str):
 	"""Bots occasionally send unprompted messages"""
 	while True:
 		# Increase interval to reduce chatter
 		await asyncio.sleep(random.uniform(90, 240))
 
-		if not bots or not room_messages:
+		members = room_bots(room)
+		if not members or not room_messages.get(room):
 			continue
 
 		# Pick a chatty bot
-		active_bots = [b for b in bots if b.chattiness > 0.15]
+		active_bots = [b for b in members if b.chattiness > 0.15]
 		if not active_bots:
 			continue
 
@@ -936,25 +1185,26 @@ async def periodic_activity():
 			await bot.send(random.choice(topics))
 
 		elif action == "call_out_lurkers":
-			lurkers = [b for b in bots if b.is_lurker and b.msg_count < 3]
+			lurkers = [b for b in members if b.is_lurker and b.msg_count < 3]
 			if lurkers:
 				target = random.choice(lurkers)
 				await bot.send(f"@{target.name} lurker spotted 👁️")
 
-async def simulate_streamer_events():
+async def simulate_streamer_events(room: str):
 	"""Simulate streamer doing things that chat reacts to"""
 	while True:
 		# Less frequent streamer events to reduce bursts
 		await asyncio.sleep(random.uniform(180, 360))
 
-		if not bots:
+		members = room_bots(room)
+		if not members:
 			continue
 
 		event = random.choice(STREAMER_EVENTS)
 
 		# Multiple bots react at once (like real chat)
 		num_reactors = random.randint(2, 5)
-		reactors = random.sample(bots, min(num_reactors, len(bots)))
+		reactors = random.sample(members, min(num_reactors, len(members)))
 
 		reactions = {
 			"took damage": ["NOOO", "Sadge", "oof", "rip", "unlucky"],
@@ -978,55 +1228,411 @@ async def simulate_streamer_events():
 				msg += f" {random.choice(list(SEVENTV_EMOTES.keys()))}"
 			await bot.send(msg)
 
-async def main():
-	# Determine persona count up front so startup messaging reflects what will actually spawn
-	persona_count = len(PERSONAS)
-	effective_bots = persona_count
-
-	print(f"🤖 Starting bot swarm: {effective_bots} bots → {ROOM_ID}")
+async def serve_metrics(port: int):
+	async def handle_metrics(request):
+		return web.Response(body=metrics.render().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+	app = web.Application()
+	app.router.add_get("/metrics", handle_metrics)
+	runner = web.AppRunner(app)
+	await runner.setup()
+	await web.TCPSite(runner, "0.0.0.0", port).start()
+	print(f"📈 Metrics on :{port}/metrics")
+
+def personas_for_room(count: int) -> List[dict]:
+	"""count personas in random order; each is used once before any repeats."""
+	chosen = []
+	while len(chosen) < count:
+		batch = PERSONAS.copy()
+		random.shuffle(batch)
+		chosen.extend(batch)
+	return chosen[:count]
+
+def swarm_status() -> dict:
+	"""This process's bots per room plus social/LLM totals; workers send it to the supervisor."""
+	llm_calls, llm_total = llm_seconds.totals()
+	rooms = {}
+	for b in bots:
+		room = rooms.setdefault(b.room, {"bots": 0, "alive": 0, "messages": 0})
+		room["bots"] += 1
+		room["alive"] += 1 if b.bot_sio and b.bot_sio.connected else 0
+		room["messages"] += b.msg_count
+	return {
+		"rooms": rooms,
+		"friendships": sum(len(b.friendships) for b in bots),
+		"beef": sum(len(b.beef) for b in bots),
+		"lurkers": sum(1 for b in bots if b.is_lurker),
+		"llm_calls": llm_calls,
+		"llm_seconds": llm_total,
+		"fallbacks": fallback_replies.total(),
+		"cache_hits": response_cache.hits,
+		"cache_misses": response_cache.misses,
+	}
+
+def merge_status(statuses) -> dict:
+	merged = {"rooms": {}, "friendships": 0, "beef": 0, "lurkers": 0,
+		"llm_calls": 0, "llm_seconds": 0.0, "fallbacks": 0, "cache_hits": 0, "cache_misses": 0}
+	for status in statuses:
+		# a room's bots can be split over several workers
+		for room, counts in status["rooms"].items():
+			totals = merged["rooms"].setdefault(room, {"bots": 0, "alive": 0, "messages": 0})
+			for key in totals:
+				totals[key] += counts[key]
+		for key in ("friendships", "beef", "lurkers", "llm_calls", "llm_seconds", "fallbacks",
+				"cache_hits", "cache_misses"):
+			merged[key] += status[key]
+	return merged
+
+def print_status(status: dict, label: str = "Status"):
+	rooms = status["rooms"].values()
+	alive = sum(r["alive"] for r in rooms)
+	total = sum(r["bots"] for r in rooms)
+	total_msgs = sum(r["messages"] for r in rooms)
+	print(f"📊 {label}: {alive}/{total} bots in {len(status['rooms'])} rooms | {total_msgs} messages")
+	print(f"💬 Social: {status['friendships']} friendships | {status['beef']} beefs | {status['lurkers']} lurkers")
+	if status["llm_calls"]:
+		print(f"⏱️ LLM: {status['llm_calls']} calls | avg {status['llm_seconds'] / status['llm_calls']:.2f}s | "
+			f"{status['fallbacks'] / status['llm_calls']:.0%} fallbacks")
+	lookups = status["cache_hits"] + status["cache_misses"]
+	if lookups:
+		print(f"🗃️ Cache: {status['cache_hits']}/{lookups} replies from cache ({status['cache_hits'] / lookups:.0%})")
+
+async def main(parts: List[Tuple[str, List[dict], bool]], status_queue=None, worker: int = 0):
+	"""Run one bot per persona of each (room, personas, owner) part on this event loop.
+
+	Only a room's owner part (one per room across the swarm) starts its
+	seed/periodic/streamer events. Under the supervisor, status goes to
+	status_queue instead of stdout.
+	"""
+	rooms = part_rooms(parts)
+	total = sum(len(personas) for _, personas, _ in parts)
+	print(f"🤖 Starting bot swarm: {total} bots in {len(rooms)} rooms → {', '.join(rooms)}")
 	print(f"🎯 Server: {SERVER_URL}")
 
+	if BOT_METRICS_PORT:
+		# one port per worker process
+		await serve_metrics(BOT_METRICS_PORT + worker)
+
 	# Load emotes before spawning to allow bots to reference them
 	await load_7tv_emotes()
 
 	print("🚀 Spawning bots...")
 
-	# Enforce exactly one bot per persona: use persona count as the number of bots
-	if NUM_BOTS != persona_count:
-		print(f"Note: NUM_BOTS={NUM_BOTS} ignored — spawning one bot per persona ({persona_count})")
-
-	# Spawn exactly one bot per persona, shuffled so assignment is random
-	personas_order = PERSONAS.copy()
-	random.shuffle(personas_order)
-
-	for i, persona in enumerate(personas_order):
-		asyncio.create_task(spawn_bot(i, persona))
-		await asyncio.sleep(0.5)  # Stagger spawns
+	# Stagger spawns, but keep the whole ramp-up within ~30s for large swarms
+	stagger = min(0.5, 30 / max(1, total))
+	idx = 0
+	for room, personas, _ in parts:
+		for persona in personas:
+			asyncio.create_task(spawn_bot(idx, room, persona))
+			idx += 1
+			await asyncio.sleep(stagger)
 
 	# Give bots a moment to connect and register
 	await asyncio.sleep(3)
 	connected = sum(1 for b in bots if b.bot_sio and b.bot_sio.connected)
 	print(f"🚨 Spawned {len(bots)} bot objects, {connected} currently connected")
 
-	await seed_conversation()
-	asyncio.create_task(periodic_activity())
-	asyncio.create_task(simulate_streamer_events())
+	for room, _, owner in parts:
+		if owner:
+			asyncio.create_task(seed_conversation(room))
+			asyncio.create_task(periodic_activity(room))
+			asyncio.create_task(simulate_streamer_events(room))
+
+	try:
+		while True:
+			if status_queue is not None:
+				await asyncio.sleep(WORKER_REPORT_INTERVAL)
+				status_queue.put((worker, swarm_status()))
+			else:
+				await asyncio.sleep(STATUS_INTERVAL)
+				print_status(swarm_status())
+	except KeyboardInterrupt:
+		print("\n👋 Shutting down swarm...")
+	finally:
+		await llm.close()
 
+# ----------------------------------------------------------------------
+# SUPERVISOR: rooms sharded over worker processes, one event loop each
+# ----------------------------------------------------------------------
+STATUS_INTERVAL = 60
+WORKER_REPORT_INTERVAL = 15
+
+def room_parts(rooms: List[str], bots_per_room: int) -> List[Tuple[str, List[dict], bool]]:
+	"""Every room as a single (room, personas, owner) part; personas are shuffled per room."""
+	return [(room, personas_for_room(bots_per_room), True) for room in rooms]
+
+def shard_rooms(rooms: List[str], bots_per_room: int, workers: int) -> List[List[Tuple[str, List[dict], bool]]]:
+	"""Split the swarm's (room, personas, owner) parts over at most `workers` shards.
+
+	With at least as many rooms as workers, rooms are dealt round-robin whole.
+	Otherwise the bots are cut into even runs, so one big room is spread over
+	several event loops; its bots still see each other's messages through the
+	server. The part holding a room's first bot owns the room, so its
+	seed/periodic/streamer events fire once.
+	"""
+	parts = room_parts(rooms, bots_per_room)
+	workers = max(1, min(workers, len(rooms) * bots_per_room))
+	if len(rooms) >= workers:
+		return [parts[i::workers] for i in range(workers)]
+	total = len(rooms) * bots_per_room
+	shards = []
+	for worker in range(workers):
+		shard = []
+		pos, end = total * worker // workers, total * (worker + 1) // workers
+		while pos < end:
+			index, first = divmod(pos, bots_per_room)
+			room, personas, _ = parts[index]
+			take = min(end - pos, bots_per_room - first)
+			shard.append((room, personas[first:first + take], first == 0))
+			pos += take
+		shards.append(shard)
+	return shards
+
+def part_rooms(parts) -> List[str]:
+	"""The distinct rooms of (room, personas, owner) parts, in order."""
+	return list(dict.fromkeys(room for room, _, _ in parts))
+
+def run_worker(worker: int, parts: List[Tuple[str, List[dict], bool]], status_queue, workers: int):
+	signal.signal(signal.SIGTERM, signal.SIG_DFL)
+	# LLM_CONCURRENCY is for the whole swarm; each worker gets its share
+	scheduler.concurrency = max(1, -(-scheduler.concurrency // workers))
+	# forked workers inherit Faker's RNG state; without this every shard picks the same names
+	fake.seed_instance()
+	try:
+		asyncio.run(main(parts, status_queue, worker))
+	except KeyboardInterrupt:
+		pass
+
+def supervise(rooms: List[str], bots_per_room: int, workers: int):
+	"""Start one worker per shard, restart any that die and print merged status."""
+	shards = shard_rooms(rooms, bots_per_room, workers)
+	status_queue = multiprocessing.Queue()
+
+	def start(worker: int) -> multiprocessing.Process:
+		proc = multiprocessing.Process(target=run_worker, name=f"swarm-{worker}",
+			args=(worker, shards[worker], status_queue, len(shards)), daemon=True)
+		proc.start()
+		return proc
+
+	# docker stop sends SIGTERM; unwind through the finally below
+	signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+	print(f"🧭 Supervisor: {len(rooms)} rooms × {bots_per_room} bots over {len(shards)} workers")
+	procs = [start(i) for i in range(len(shards))]
+	latest = {}
+	next_report = time.time() + STATUS_INTERVAL
 	try:
 		while True:
-			await asyncio.sleep(60)
-			alive = sum(1 for b in bots if b.bot_sio and b.bot_sio.connected)
-			total_msgs = sum(b.msg_count for b in bots)
-			# Show relationship stats
-			total_friendships = sum(len(b.friendships) for b in bots)
-			total_beef = sum(len(b.beef) for b in bots)
-			lurkers = sum(1 for b in bots if b.is_lurker)
-			print(f"📊 Status: {alive}/{len(bots)} bots | {total_msgs} messages")
-			print(f"💬 Social: {total_friendships} friendships | {total_beef} beefs | {lurkers} lurkers")
+			try:
+				worker, status = status_queue.get(timeout=1)
+				latest[worker] = status
+			except queue.Empty:
+				pass
+			for i, proc in enumerate(procs):
+				if not proc.is_alive():
+					print(f"⚠️ Worker {i} exited with {proc.exitcode}; restarting {', '.join(part_rooms(shards[i]))}")
+					latest.pop(i, None)
+					procs[i] = start(i)
+			if time.time() >= next_report:
+				next_report += STATUS_INTERVAL
+				if latest:
+					print_status(merge_status(latest.values()), f"Swarm ({len(latest)}/{len(procs)} workers reporting)")
 	except KeyboardInterrupt:
 		print("\n👋 Shutting down swarm...")
+	finally:
+		for proc in procs:
+			proc.terminate()
+		for proc in procs:
+			proc.join(5)
+
+
+# ----------------------------------------------------------------------
+# BENCHMARK MODE: python bot_swarm.py --bench [options]
+# Thousands of lightweight clients (no personas, no LLM) spread over N rooms,
+# each sending timestamped messages; every receiver records end-to-end
+# delivery latency. Prints/writes a JSON report.
+# ----------------------------------------------------------------------
+BENCH_PREFIX = "bench:"
+
+def percentile(samples: list, q: float) -> Optional[float]:
+	"""Nearest-rank percentile of an already sorted list."""
+	if not samples:
+		return None
+	return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def summarize_ms(samples: list) -> dict:
+	samples = sorted(samples)
+	return {
+		"count": len(samples),
+		"p50_ms": round(percentile(samples, 0.50) * 1000, 3) if samples else None,
+		"p90_ms": round(percentile(samples, 0.90) * 1000, 3) if samples else None,
+		"p99_ms": round(percentile(samples, 0.99) * 1000, 3) if samples else None,
+		"max_ms": round(samples[-1] * 1000, 3) if samples else None,
+	}
+
+class BenchStats:
+	def __init__(self):
+		self.connect_times = []
+		self.connect_failures = 0
+		self.latencies = []
+		self.sent = 0
+		self.expected = 0  # deliveries owed: room size at send time, per message
+		self.received = 0
+		self.rate_limited = 0
+
+class BenchClient:
+	"""One socket in one room: sends bench messages and times the ones it receives."""
+
+	def __init__(self, idx: int, room: str, stats: BenchStats, room_sizes: dict):
+		self.user = f"bench{idx}"
+		self.room = room
+		self.stats = stats
+		self.room_sizes = room_sizes
+		self.sio = socketio.AsyncClient(reconnection=False)
+		self.sio.on("message", self.on_message)
+		self.sio.on("messages", self.on_messages)
+		self.sio.on("rate_limited", self.on_rate_limited)
+
+	async def on_message(self, data):
+		text = data.get("text", "")
+		if text.startswith(BENCH_PREFIX):
+			self.stats.latencies.append(time.time() - float(text[len(BENCH_PREFIX):].split(" ", 1)[0]))
+			self.stats.received += 1
+
+	async def on_messages(self, data):
+		for message in data.get("messages", []):
+			await self.on_message(message)
+
+	async def on_rate_limited(self, data):
+		self.stats.rate_limited += 1
+
+	async def connect(self):
+		started = time.perf_counter()
+		try:
+			await self.sio.connect(SERVER_URL, transports=["websocket"])
+			await self.sio.emit("join", {"room": self.room, "user": self.user})
+		except Exception as e:
+			self.stats.connect_failures += 1
+			print(f"{self.user} failed to connect: {e}")
+			return False
+		self.stats.connect_times.append(time.perf_counter() - started)
+		self.room_sizes[self.room] = self.room_sizes.get(self.room, 0) + 1
+		return True
+
+	async def send_loop(self, interval: float, until: float):
+		# random phase so clients don't all fire on the same tick
+		await asyncio.sleep(random.uniform(0, interval))
+		n = 0
+		while time.time() < until and self.sio.connected:
+			n += 1
+			await self.sio.emit("message", {
+				"room": self.room,
+				"user": self.user,
+				"text": f"{BENCH_PREFIX}{time.time():.6f} {n}",
+			})
+			self.stats.sent += 1
+			self.stats.expected += self.room_sizes[self.room]
+			await asyncio.sleep(min(interval, max(0.0, until - time.time())))
+
+async def run_benchmark(args) -> dict:
+	stats = BenchStats()
+	room_sizes = {}
+	rooms = [f"{args.room_prefix}{r}" for r in range(args.rooms)]
+	clients = [BenchClient(i, rooms[i % len(rooms)], stats, room_sizes) for i in range(args.clients)]
+
+	print(f"🏁 Benchmark: {args.clients} clients in {args.rooms} rooms → {SERVER_URL}")
+	gate = asyncio.Semaphore(args.connect_concurrency)
+
+	async def connect(client):
+		async with gate:
+			return await client.connect()
+
+	connect_started = time.perf_counter()
+	connected = [c for c, ok in zip(clients, await asyncio.gather(*(connect(c) for c in clients))) if ok]
+	connect_elapsed = time.perf_counter() - connect_started
+	print(f"🔌 {len(connected)}/{len(clients)} connected in {connect_elapsed:.1f}s")
+
+	# settle joins before timing anything
+	await asyncio.sleep(1)
+	interval = len(connected) / args.rate if args.rate > 0 else float("inf")
+	started = time.time()
+	until = started + args.duration
+	await asyncio.gather(*(c.send_loop(interval, until) for c in connected))
+	send_elapsed = time.time() - started
+	await asyncio.sleep(args.drain)
+
+	await asyncio.gather(*(c.sio.disconnect() for c in connected), return_exceptions=True)
+
+	return {
+		"server": SERVER_URL,
+		"config": {
+			"clients": args.clients,
+			"rooms": args.rooms,
+			"target_rate": args.rate,
+			"duration_s": args.duration,
+		},
+		"connect": {
+			**summarize_ms(stats.connect_times),
+			"failed": stats.connect_failures,
+			"total_s": round(connect_elapsed, 3),
+		},
+		"messages": {
+			"sent": stats.sent,
+			"rate_limited": stats.rate_limited,
+			"deliveries_expected": stats.expected,
+			"deliveries_received": stats.received,
+			"delivery_ratio": round(stats.received / stats.expected, 4) if stats.expected else None,
+		},
+		"throughput": {
+			"sent_per_s": round(stats.sent / send_elapsed, 1),
+			"delivered_per_s": round(stats.received / send_elapsed, 1),
+		},
+		"latency": summarize_ms(stats.latencies),
+	}
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Bot swarm for the chat server")
+	parser.add_argument("--bench", action="store_true", help="run the load benchmark instead of the persona swarm")
+	parser.add_argument("--clients", type=int, default=int(os.getenv("BENCH_CLIENTS", "1000")))
+	parser.add_argument("--rooms", type=int, default=int(os.getenv("BENCH_ROOMS", "10")))
+	parser.add_argument("--rate", type=float, default=float(os.getenv("BENCH_RATE", "100")),
+		help="messages per second across all clients")
+	parser.add_argument("--duration", type=float, default=float(os.getenv("BENCH_DURATION", "30")))
+	parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight messages")
+	parser.add_argument("--connect-concurrency", type=int, default=100)
+	parser.add_argument("--room-prefix", default="bench-")
+	parser.add_argument("--report", help="write the JSON report here (default: stdout)")
+	parser.add_argument("--swarm-rooms", help="comma-separated rooms for the swarm (default: SWARM_ROOMS)")
+	parser.add_argument("--bots-per-room", type=int, default=BOTS_PER_ROOM,
+		help="bots in each room (default: one per persona)")
+	parser.add_argument("--workers", type=int, default=SWARM_WORKERS,
+		help="swarm processes (0 = one per core); rooms are dealt out whole, or their bots "
+			"split between workers when there are fewer rooms than workers")
+	return parser.parse_args()
+
+async def bench_main(args):
+	report = await run_benchmark(args)
+	text = json.dumps(report, indent=2)
+	if args.report:
+		with open(args.report, "w") as f:
+			f.write(text + "\n")
+		print(f"📝 Report written to {args.report}")
+	else:
+		print(text)
 
 
 
 if __name__ == "__main__":
-		asyncio.run(main())
\ No newline at end of file
+		cli_args = parse_args()
+		if cli_args.bench:
+			asyncio.run(bench_main(cli_args))
+		else:
+			rooms = cli_args.swarm_rooms.split(",") if cli_args.swarm_rooms else SWARM_ROOMS
+			rooms = [room.strip() for room in rooms if room.strip()]
+			bots_per_room = cli_args.bots_per_room or len(PERSONAS)
+			workers = cli_args.workers or os.cpu_count() or 1
+			if "NUM_BOTS" in os.environ and NUM_BOTS != bots_per_room:
+				print(f"Note: NUM_BOTS={NUM_BOTS} ignored — spawning {bots_per_room} bots per room (BOTS_PER_ROOM)")
+			if workers > 1 and len(rooms) * bots_per_room > 1:
+				supervise(rooms, bots_per_room, workers)
+			else:
+				asyncio.run(main(room_parts(rooms, bots_per_room)))
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Multi-worker support for server.py.
+
+Emits are fanned out between worker processes by a python-socketio pub/sub
+client manager (Flask-SocketIO's ``message_queue`` hook). The same channel also
+carries room state operations (joins, leaves, stored messages) so every worker
+keeps a replica of rooms, history and presence and can serve any client that
+the sticky load balancer sends its way.
+
+Backends are picked from the queue URL:
+
+- ``redis://`` / ``rediss://``  -> socketio.RedisManager (needs ``redis``)
+- ``kafka://``                  -> socketio.KafkaManager (needs ``kafka-python``)
+- ``zmq+tcp://``                -> socketio.ZmqManager (needs ``pyzmq``)
+- ``local://``                  -> LocalManager, between servers in one process
+- anything else                 -> socketio.KombuManager (amqp://, ...)
+"""
+import json
+import logging
+import queue
+import threading
+
+import socketio
+
+from payloads import plain
+
+log = logging.getLogger(__name__)
+
+
+class StateSyncMixin:
+    """Adds a ``state`` message type on top of a PubSubManager backend.
+
+    State messages never reach Socket.IO clients; they are handed to
+    ``state_handler`` (set by server.py) on every worker except the sender.
+    """
+    state_handler = None
+
+    def publish_state(self, op, **fields):
+        self._publish({'method': 'state', 'op': op, 'host_id': self.host_id, **fields})
+
+    def _publish(self, data):
+        # Pre-encoded payloads only exist inside this process
+        if data.get('method') == 'emit':
+            data = dict(data, data=plain(data['data']))
+        return super()._publish(data)
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if not isinstance(data, dict):
+                try:
+                    data = json.loads(message)
+                except (TypeError, ValueError):
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'state':
+                if data.get('host_id') != self.host_id and self.state_handler:
+                    try:
+                        self.state_handler(data)
+                    except Exception:
+                        log.exception("Error applying cluster state op %s", data.get('op'))
+                continue
+            yield data
+
+
+class LocalManager(socketio.PubSubManager):
+    """In-process message queue for single-host experiments.
+
+    Every manager created in this process on the same channel receives what
+    the others publish, so several SocketIO servers in one interpreter behave
+    like workers sharing a broker. Messages go through JSON just like they
+    would on a real queue. server.py keeps module-level state, so each server
+    has to be its own import of the module, and clients must connect over
+    real sockets (Flask-SocketIO's test_client refuses message queues).
+    """
+    name = 'local'
+
+    _subscribers = {}  # channel -> [queue.Queue]
+    _lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        encoded = json.dumps(data)
+        with self._lock:
+            inboxes = list(self._subscribers.get(self.channel, ()))
+        for inbox in inboxes:
+            inbox.put(encoded)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def _backend_for(url):
+    if url.startswith('local://'):
+        return LocalManager
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager
+    if url.startswith('kafka://'):
+        return socketio.KafkaManager
+    if url.startswith('zmq'):
+        return socketio.ZmqManager
+    return socketio.KombuManager
+
+
+def create_client_manager(url, channel='flask-socketio'):
+    """Build a state-syncing client manager for ``SocketIO(client_manager=...)``."""
+    base = _backend_for(url)
+    manager_class = type(f"Synced{base.__name__}", (StateSyncMixin, base), {})
+    return manager_class(url, channel=channel)
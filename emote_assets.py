@@ -0,0 +1,84 @@
+"""Index of emote image files for server.py.
+
+Every file in the emotes directory is stat'ed and hashed once at startup (and
+again only when its mtime/size change). The content hash gives each image a
+versioned URL (``/emotes/<file>?h=<digest>``) that can be cached forever, and
+doubles as the ETag for conditional requests on the plain URL.
+"""
+import hashlib
+import os
+
+from werkzeug.security import safe_join
+
+
+class Asset:
+    __slots__ = ('path', 'size', 'mtime', 'digest')
+
+    def __init__(self, path, size, mtime, digest):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+class AssetIndex:
+    """filename -> Asset for the files directly inside ``directory``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+
+    def _current(self, filename, path, st):
+        asset = self.assets.get(filename)
+        if asset is None or asset.size != st.st_size or asset.mtime != st.st_mtime:
+            asset = Asset(path, st.st_size, st.st_mtime, _digest(path))
+        return asset
+
+    def _refresh(self, filename, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.assets.pop(filename, None)
+            return None
+        asset = self.assets[filename] = self._current(filename, path, st)
+        return asset
+
+    def scan(self):
+        """(Re)index the directory; unchanged files are not re-hashed.
+
+        The new index is built aside and swapped in, so a scan on a worker
+        thread never changes the dict under a reader.
+        """
+        if not os.path.isdir(self.directory):
+            return self
+        assets = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                assets[entry.name] = self._current(entry.name, entry.path, entry.stat())
+        self.assets = assets
+        return self
+
+    def lookup(self, filename):
+        """Asset for filename, picking up files added since the last scan."""
+        path = safe_join(self.directory, filename)
+        if path is None:
+            return None
+        return self._refresh(filename, path)
+
+    def url_for(self, filename):
+        """Versioned URL path (relative to /emotes/) for filename."""
+        asset = self.assets.get(filename)
+        if asset is None:
+            return filename
+        return f"{filename}?h={asset.digest}"
+
+    def total_bytes(self):
+        return sum(asset.size for asset in self.assets.values())
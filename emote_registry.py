@@ -0,0 +1,145 @@
+"""Emote map registry for server.py.
+
+Loads ``emotes/emotes.json``, serializes it canonically and derives a content
+version from that body. Clients are only told the version over the websocket
+and fetch the map itself from ``/emotes.json``, which is cacheable and
+revalidates against the version as its ETag.
+
+The file can be edited while the server runs: ``reload_if_changed`` (polled by
+server.py) swaps in the new map in one assignment and returns the added and
+removed entries so connected clients can be patched instead of reconnected.
+
+Each EmoteSet also carries a token index used to split chat messages into
+text and emote segments once on the server, instead of on every viewer.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+
+from payloads import dumps
+
+log = logging.getLogger(__name__)
+
+
+_WHITESPACE_SPLIT = re.compile(r'(\s+)')
+# Characters that may trail an emote without being part of it ("Clap!!")
+_TRAILING_PUNCTUATION = '.,!?'
+
+
+class EmoteSet:
+    """One immutable generation of the emote map."""
+
+    __slots__ = ('emotes', 'urls', 'body', 'gzip_body', 'version', 'index')
+
+    def __init__(self, emotes, urls=None):
+        self.emotes = emotes
+        # What clients see: name -> image path under /emotes/, content-hashed
+        # when an asset index is available
+        self.urls = urls if urls is not None else emotes
+        self.body = dumps(self.urls).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, mtime=0)
+        self.version = hashlib.sha256(self.body).hexdigest()[:16]
+        # Emotes only match whole whitespace-delimited words, so a
+        # case-folded dict lookup per word is all the matching needed
+        self.index = {name.lower(): name for name in emotes}
+
+    def _match(self, word):
+        """Emote name at the start of word and the length it covers."""
+        index = self.index
+        end = len(word)
+        while end:
+            name = index.get(word[:end].lower())
+            if name is not None:
+                return name, end
+            if word[end - 1] not in _TRAILING_PUNCTUATION:
+                return None, 0
+            end -= 1
+        return None, 0
+
+    def tokenize(self, text):
+        """Split text into ``[{'t': text}, {'e': emote name}, ...]`` segments."""
+        segments = []
+        pending = []
+        for part in _WHITESPACE_SPLIT.split(text):
+            if not part:
+                continue
+            if part[0].isspace():
+                pending.append(part)
+                continue
+            name, end = self._match(part)
+            if name is None:
+                pending.append(part)
+                continue
+            if pending:
+                segments.append({'t': ''.join(pending)})
+                pending = []
+            segments.append({'e': name})
+            if end < len(part):
+                pending.append(part[end:])
+        if pending:
+            segments.append({'t': ''.join(pending)})
+        return segments
+
+
+class EmoteRegistry:
+    """Holds the current EmoteSet; readers grab ``registry.current`` once."""
+
+    def __init__(self, path, assets=None):
+        self.path = path
+        self.assets = assets
+        self.current = EmoteSet({})
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        stamp = self._file_stamp()
+        if stamp is None:
+            log.warning("No %s found; clients will receive empty emote map", self.path)
+            self._stamp = None
+            return self.current
+        with open(self.path, 'r', encoding='utf-8') as f:
+            emotes = json.load(f)
+        urls = None
+        if self.assets is not None:
+            self.assets.scan()
+            urls = {name: self.assets.url_for(filename) for name, filename in emotes.items()}
+        self.current = EmoteSet(emotes, urls)
+        # Only remember the stamp once parsing succeeded, so a half-written
+        # file is retried on the next poll
+        self._stamp = stamp
+        log.info("Loaded %d emotes from %s (version %s)",
+                 len(self.current.emotes), self.path, self.current.version)
+        return self.current
+
+    def reload_if_changed(self):
+        """Reload the file if it changed on disk.
+
+        Returns an ``emotes_delta`` payload, or None when nothing changed.
+        """
+        if self._file_stamp() == self._stamp:
+            return None
+        previous = self.current
+        current = self.load()
+        if current.version == previous.version:
+            return None
+        return {
+            **self.version_info(),
+            'previous': previous.version,
+            'added': {name: url for name, url in current.urls.items()
+                      if previous.urls.get(name) != url},
+            'removed': [name for name in previous.urls if name not in current.urls],
+        }
+
+    def version_info(self):
+        current = self.current
+        return {'version': current.version, 'count': len(current.emotes),
+                'url': f"/emotes.json?v={current.version}"}
@@ -0,0 +1,150 @@
+"""Durable room history for server.py, kept in SQLite (WAL mode).
+
+Handlers only append to an in-memory queue; a background task writes whatever
+has accumulated in one transaction every flush interval, so storing a message
+never waits on the disk. The blocking SQLite call itself is handed to
+``offload`` (a native thread pool under gevent/eventlet) so it doesn't stall
+the event loop either.
+
+When a room is first used after a restart (or comes back after being pruned)
+``recent`` reads only its newest N messages through the ``(room, id)`` index.
+Nothing is loaded at startup, so restart time depends neither on the number of
+rooms nor on how large the log has grown. ``page_before``/``page_since`` serve
+history older than the in-memory window through the ``(room, seq)`` index.
+"""
+import json
+import sqlite3
+import threading
+from collections import deque
+
+from payloads import dumps
+from records import Message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    body TEXT NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_room_id ON messages (room, id);
+CREATE TABLE IF NOT EXISTS rooms (
+    room TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+
+def _run_inline(fn, *args):
+    return fn(*args)
+
+
+class HistoryStore:
+    def __init__(self, path, offload=_run_inline):
+        self.path = path
+        self.offload = offload
+        self.pending = deque()  # (room_id, encoded message)
+        self.written = 0
+        # held by the caller around each write, so flush() and close() (from
+        # atexit) never interleave transactions on the shared connection
+        self._lock = threading.Lock()
+        # the connection is used from whichever thread offload picks
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(messages)')}
+        if 'seq' not in columns:  # databases created before sequence ids
+            self.db.execute('ALTER TABLE messages ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        self.db.execute('CREATE INDEX IF NOT EXISTS messages_room_seq ON messages (room, seq)')
+        # pages are read on a second connection; WAL lets it run alongside writes
+        self.reader = sqlite3.connect(path, check_same_thread=False)
+
+    def append(self, room_id, message):
+        """Queue message for the next flush; never touches the disk."""
+        self.pending.append((room_id, dumps(message), message.seq))
+
+    def _write(self, batch):
+        last_ids = {}
+        self.db.execute('BEGIN')
+        try:
+            for room_id, body, seq in batch:
+                cursor = self.db.execute(
+                    'INSERT INTO messages (room, body, seq) VALUES (?, ?, ?)', (room_id, body, seq))
+                last_ids[room_id] = cursor.lastrowid
+            self.db.executemany(
+                'INSERT INTO rooms (room, last_id) VALUES (?, ?) '
+                'ON CONFLICT (room) DO UPDATE SET last_id = excluded.last_id',
+                last_ids.items())
+            self.db.execute('COMMIT')
+        except BaseException:
+            if self.db.in_transaction:
+                self.db.execute('ROLLBACK')
+            raise
+        self.written += len(batch)
+
+    def _drain(self):
+        batch = []
+        while self.pending:
+            batch.append(self.pending.popleft())
+        return batch
+
+    def flush(self):
+        """Write everything queued so far in one transaction."""
+        with self._lock:
+            batch = self._drain()
+            if not batch:
+                return 0
+            try:
+                self.offload(self._write, batch)
+            except Exception:
+                # keep the messages for the next attempt, in order
+                self.pending.extendleft(reversed(batch))
+                raise
+            return len(batch)
+
+    def _page(self, sql, args):
+        room_id = args[0]
+        return [Message.from_dict(room_id, json.loads(body))
+                for (body,) in self.reader.execute(sql, args).fetchall()]
+
+    def page_before(self, room_id, seq, limit):
+        """Up to ``limit`` stored messages with a seq below ``seq``, oldest first."""
+        rows = self.offload(self._page,
+                            'SELECT body FROM messages WHERE room = ? AND seq < ? '
+                            'ORDER BY seq DESC LIMIT ?', (room_id, seq, limit))
+        rows.reverse()
+        return rows
+
+    def recent(self, room_id, limit):
+        """The newest ``limit`` stored messages of a room, oldest first."""
+        rows = self.offload(self._page,
+                            'SELECT body FROM messages WHERE room = ? ORDER BY id DESC LIMIT ?',
+                            (room_id, limit))
+        rows.reverse()
+        return rows
+
+    def page_since(self, room_id, seq, limit):
+        """Up to ``limit`` stored messages with a seq above ``seq``, oldest first."""
+        return self.offload(self._page,
+                            'SELECT body FROM messages WHERE room = ? AND seq > ? '
+                            'ORDER BY seq LIMIT ?', (room_id, seq, limit))
+
+    def last_seq(self, room_id):
+        """Highest stored seq of a room (0 if it has none)."""
+        return self.offload(self._last_seq, room_id)
+
+    def _last_seq(self, room_id):
+        (seq,) = self.reader.execute(
+            'SELECT max(seq) FROM messages WHERE room = ?', (room_id,)).fetchone()
+        return seq or 0
+
+    def close(self):
+        """Flush synchronously and close the database."""
+        with self._lock:
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+            self.db.close()
+            self.reader.close()
@@ -0,0 +1,80 @@
+"""Response cache for bot_swarm.py's LLM calls.
+
+During emote storms and "real"/"true" chains many prompts are duplicates in
+all but the usernames and the number of repeats. Entries are keyed by persona
+plus ``context_key`` of the recent chat. That key lowercases the text, keeps
+only the words, collapses repeats within a message and drops consecutive
+duplicate messages.
+
+An entry holds up to ``variants`` completions. Until it has that many,
+lookups miss so the LM fills it. After that a lookup returns one variant at
+random, so cached replies don't repeat verbatim. Entries expire ``ttl``
+seconds after they were created, and the least recently used entry is evicted
+beyond ``max_entries``.
+
+Environment:
+    LLM_CACHE_SIZE      entries kept (default 512, 0 = no caching)
+    LLM_CACHE_TTL       seconds an entry lives (default 120)
+    LLM_CACHE_VARIANTS  completions kept per entry (default 3)
+"""
+import hashlib
+import os
+import random
+import re
+from collections import OrderedDict
+
+_WORD = re.compile(r"\w+")
+
+
+def context_key(texts):
+    """Hash of chat lines that ignores case, punctuation and repetition."""
+    lines = []
+    for text in texts:
+        words = _WORD.findall(text.lower())
+        line = ' '.join(w for i, w in enumerate(words) if i == 0 or w != words[i - 1])
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+    return hashlib.blake2b('\n'.join(lines).encode(), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, ttl=120.0, variants=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.entries = OrderedDict()  # key -> (expires_at, [replies])
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_entries=int(os.getenv('LLM_CACHE_SIZE', 512)),
+                   ttl=float(os.getenv('LLM_CACHE_TTL', 120)),
+                   variants=int(os.getenv('LLM_CACHE_VARIANTS', 3)))
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.variants > 0
+
+    def get(self, key, now):
+        """A cached reply once the entry's pool is full, else None (a miss)."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self.entries[key]
+            entry = None
+        if entry is None or len(entry[1]) < self.variants:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry[1])
+
+    def put(self, key, reply, now):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= now:
+            entry = self.entries[key] = (now + self.ttl, [])
+        if len(entry[1]) < self.variants and reply not in entry[1]:
+            entry[1].append(reply)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
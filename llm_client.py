@@ -0,0 +1,72 @@
+"""Shared HTTP client for LLM completions (bot_swarm.py, audio_pipeline.py).
+
+Every completion used to open its own ``aiohttp.ClientSession``: a fresh
+connector, a TCP handshake and a new ephemeral port per reply. ``LLMClient``
+keeps one session per process instead, so requests reuse pooled keep-alive
+connections to the LM server. The session is created lazily on first use,
+because it has to belong to the running event loop.
+
+Environment:
+    LLM_POOL_SIZE        open connections in total (default 32, 0 = no limit)
+    LLM_POOL_PER_HOST    open connections per LM host (default 16, 0 = no limit)
+    LLM_KEEPALIVE        seconds an idle connection is kept (default 30)
+    LLM_CONNECT_TIMEOUT  seconds to get a connection, queueing included (default 2)
+    LLM_TIMEOUT          seconds for a whole request (default 10)
+"""
+import os
+from typing import Optional
+
+import aiohttp
+
+
+class LLMError(Exception):
+    """The LM server answered, but not with a 200."""
+
+    def __init__(self, status):
+        super().__init__(f"LM server returned HTTP {status}")
+        self.status = status
+
+
+class LLMClient:
+    def __init__(self, url, limit=32, limit_per_host=16, keepalive=30.0,
+                 connect_timeout=2.0, timeout=10.0):
+        self.url = url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive = keepalive
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls, url):
+        return cls(url,
+                   limit=int(os.getenv('LLM_POOL_SIZE', 32)),
+                   limit_per_host=int(os.getenv('LLM_POOL_PER_HOST', 16)),
+                   keepalive=float(os.getenv('LLM_KEEPALIVE', 30)),
+                   connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', 2)),
+                   timeout=float(os.getenv('LLM_TIMEOUT', 10)))
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def complete(self, payload) -> str:
+        """POST an OpenAI-style chat completion; return the first choice's text.
+
+        Raises LLMError on a non-200 reply, and aiohttp/asyncio errors on
+        connection failures and timeouts.
+        """
+        async with self.session.post(self.url, json=payload) as resp:
+            if resp.status != 200:
+                raise LLMError(resp.status)
+            data = await resp.json()
+        return data["choices"][0]["message"]["content"].strip()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,104 @@
+"""Admission control for LLM calls in bot_swarm.py.
+
+Bots decide to reply independently, so one chat message can make a dozen of
+them hit the LM server at once. Every completion goes through ``run`` instead:
+
+- at most ``concurrency`` requests are in flight; the rest wait in a priority
+  queue (mentions before replies before background chatter, FIFO within a
+  priority);
+- the queue holds at most ``max_queue`` waiters. When it is full a new request
+  displaces the lowest-priority waiter if it outranks it, otherwise it is
+  refused. Either way the loser gets ``Overloaded`` and the bot answers from
+  its canned replies;
+- a request that reaches the front after its deadline, or so close to it that
+  a typical completion (a moving average of recent ones) would finish too
+  late, gets ``Expired``; the reply is skipped because chat has moved on.
+
+Environment:
+    LLM_CONCURRENCY     requests in flight per swarm (default 4)
+    LLM_QUEUE_MAX       requests waiting for a slot (default 16)
+    LLM_REPLY_DEADLINE  seconds after a message a reply is still relevant (default 20)
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+MENTION = 0
+REPLY = 1
+CHATTER = 2
+
+
+class Overloaded(Exception):
+    """Shed because the queue was full."""
+
+
+class Expired(Exception):
+    """Dropped because the reply would arrive after its deadline."""
+
+
+class LLMScheduler:
+    def __init__(self, concurrency=4, max_queue=16, deadline=20.0):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline  # default relevance window, seconds
+        self.active = 0
+        self.waiting = []  # heap of [priority, order, future]
+        self._order = itertools.count()
+        self.latency = None  # moving average of completion time, seconds
+
+    @classmethod
+    def from_env(cls):
+        return cls(concurrency=int(os.getenv('LLM_CONCURRENCY', 4)),
+                   max_queue=int(os.getenv('LLM_QUEUE_MAX', 16)),
+                   deadline=float(os.getenv('LLM_REPLY_DEADLINE', 20)))
+
+    def _admit(self, priority):
+        """Queue a waiter; return its future, or raise Overloaded."""
+        if len(self.waiting) >= self.max_queue:
+            worst = max(self.waiting, default=None)  # lowest priority, newest
+            if worst is None or worst[0] <= priority:
+                raise Overloaded()
+            self.waiting.remove(worst)
+            heapq.heapify(self.waiting)
+            worst[2].set_exception(Overloaded())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, [priority, next(self._order), future])
+        return future
+
+    def _release(self):
+        # hand the slot straight to the best live waiter, if any
+        while self.waiting:
+            _, _, future = heapq.heappop(self.waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    async def run(self, call, priority=CHATTER, deadline=None):
+        """Await ``call()`` once a slot is free; see the module docstring."""
+        if self.active < self.concurrency and not self.waiting:
+            self.active += 1
+        else:
+            future = self._admit(priority)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    self.waiting = [entry for entry in self.waiting if entry[2] is not future]
+                    heapq.heapify(self.waiting)
+                elif future.exception() is None:
+                    self._release()  # the slot was already ours
+                raise
+
+        try:
+            if deadline is not None and time.time() + (self.latency or 0) > deadline:
+                raise Expired()
+            started = time.perf_counter()
+            result = await call()
+            elapsed = time.perf_counter() - started
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            return result
+        finally:
+            self._release()
@@ -0,0 +1,140 @@
+"""Logging for server.py and the modules it loads.
+
+Handlers only put records on an in-memory queue; a QueueListener thread does
+the formatting and the (unbuffered, in Docker) stdout writes, so a socket
+handler never waits on the console. Under gevent/eventlet the queue, the thread
+and its lock are the unpatched originals: a patched listener would be a
+greenlet whose blocking writes still stall the whole event loop. Per-message chat logs go to the
+``server.messages`` logger and are sampled, since logging every message is
+what capped throughput in the first place.
+
+Environment:
+    LOG_LEVEL           DEBUG/INFO/WARNING/... (default INFO)
+    LOG_FORMAT          ``text`` or ``json`` (one object per line)
+    LOG_MESSAGE_SAMPLE  log 1 in N chat messages (default 100, 1 = all, 0 = none)
+"""
+import _thread
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+from payloads import dumps
+
+MESSAGE_LOGGER = 'server.messages'
+
+# attributes every LogRecord has; anything else came in via ``extra=``
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class SampleFilter(logging.Filter):
+    """Let through one record in every ``every`` (0 drops everything)."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.seen = 0
+
+    def filter(self, record):
+        if self.every <= 0:
+            return False
+        keep = self.seen % self.every == 0
+        self.seen += 1
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return dumps(entry)
+
+
+def _native_threading():
+    """(SimpleQueue, start_new_thread, allocate_lock, RLock) that bypass monkey patching."""
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return (monkey.get_original('queue', 'SimpleQueue'),
+                    *monkey.get_original('_thread', ['start_new_thread', 'allocate_lock', 'RLock']))
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            thread = patcher.original('_thread')
+            return (patcher.original('queue').SimpleQueue,
+                    thread.start_new_thread, thread.allocate_lock, thread.RLock)
+    return queue.SimpleQueue, _thread.start_new_thread, _thread.allocate_lock, _thread.RLock
+
+
+class NativeQueueListener(logging.handlers.QueueListener):
+    """QueueListener that always runs on an OS thread."""
+
+    def __init__(self, log_queue, *handlers, start_new_thread, allocate_lock, **kwargs):
+        super().__init__(log_queue, *handlers, **kwargs)
+        self._start_new_thread = start_new_thread
+        self._allocate_lock = allocate_lock
+
+    def start(self):
+        self._thread = self._allocate_lock()  # held until _monitor returns
+        self._thread.acquire()
+        self._start_new_thread(self._run, ())
+
+    def _run(self):
+        try:
+            self._monitor()
+        finally:
+            self._thread.release()
+
+    def stop(self):
+        if self._thread is not None:
+            self.enqueue_sentinel()
+            self._thread.acquire()
+            self._thread = None
+
+
+def configure_logging():
+    """Route the root logger through a queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter('%(asctime)s.%(msecs)03dZ %(levelname)s %(name)s: %(message)s',
+                                      '%Y-%m-%dT%H:%M:%S')
+        formatter.converter = time.gmtime
+        stream.setFormatter(formatter)
+
+    simple_queue, start_new_thread, allocate_lock, rlock = _native_threading()
+    # only the listener thread writes through this handler
+    stream.lock = rlock()
+    log_queue = simple_queue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # werkzeug logs one line per HTTP request at INFO
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    logging.getLogger(MESSAGE_LOGGER).addFilter(
+        SampleFilter(int(os.getenv('LOG_MESSAGE_SAMPLE', 100))))
+
+    _listener = NativeQueueListener(log_queue, stream, respect_handler_level=True,
+                                    start_new_thread=start_new_thread, allocate_lock=allocate_lock)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
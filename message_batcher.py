@@ -0,0 +1,48 @@
+"""Per-room micro-batching of chat broadcasts for server.py.
+
+With batching enabled for a room, accepted messages are collected for a short
+window and sent as a single ``messages`` frame instead of one ``message``
+packet each. The message that opens a batch starts its window: the caller
+schedules a send for ``window_for(room_id)`` seconds later, and the batch goes
+out then or as soon as it reaches ``max_batch`` messages, whichever comes
+first. No message waits longer than the window.
+"""
+import threading
+
+
+class MessageBatcher:
+    def __init__(self, window, room_windows=None, max_batch=50):
+        self.window = window  # seconds; 0 disables batching
+        self.room_windows = room_windows or {}
+        self.max_batch = max_batch
+        self.pending = {}  # room_id -> [messages]
+        # handlers add while the timers take
+        self._lock = threading.Lock()
+
+    def window_for(self, room_id):
+        return self.room_windows.get(room_id, self.window)
+
+    def add(self, room_id, message):
+        """Queue message; returns ``(batch, opened)``.
+
+        ``opened`` is True when message started a new batch, whose send the
+        caller schedules. Once ``batch`` is full it should be taken right away.
+        """
+        with self._lock:
+            batch = self.pending.get(room_id)
+            opened = batch is None
+            if opened:
+                batch = self.pending[room_id] = []
+            batch.append(message)
+        return batch, opened
+
+    def full(self, batch):
+        return len(batch) >= self.max_batch
+
+    def take(self, room_id, batch):
+        """Claim batch for sending; False if it already went out."""
+        with self._lock:
+            if self.pending.get(room_id) is not batch:
+                return False
+            del self.pending[room_id]
+        return True
@@ -0,0 +1,152 @@
+"""Minimal Prometheus text-format metrics for server.py and bot_swarm.py.
+
+Counters and histograms are plain in-process objects that are updated on the
+hot path (a dict lookup and a couple of additions under a lock); gauges are
+callbacks evaluated only when ``/metrics`` is scraped. ``Registry.render()``
+produces the text exposition format (version 0.0.4), so Prometheus or any
+compatible agent can scrape it without pulling in prometheus_client.
+"""
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds; tuned for in-process handlers (sub-millisecond up to a stall)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# seconds; for remote calls such as LLM completions
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        # an unlabelled counter reports 0 before its first increment
+        self.values = {} if self.label_names else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self):
+        with self._lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def totals(self):
+        """(count, sum) across all label values."""
+        with self._lock:
+            return (sum(sum(series[:-1]) for series in self.series.values()),
+                    sum(series[-1] for series in self.series.values()))
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self.series.items()]
+        names = self.label_names + ('le',)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield self.name + '_bucket', _labels(names, labels + (_number(bound),)), cumulative
+            base = _labels(self.label_names, labels)
+            yield self.name + '_count', base, cumulative
+            yield self.name + '_sum', base, series[-1]
+
+
+class Gauge:
+    """Value(s) computed at scrape time.
+
+    ``collect`` returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            if value is not None:
+                yield self.name, _labels(self.label_names, labels), value
+
+
+class Registry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def gauge(self, name, help, collect, labels=()):
+        return self._add(Gauge(self.prefix + name, help, collect, labels))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
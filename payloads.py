@@ -0,0 +1,102 @@
+"""JSON encoding for Socket.IO packets.
+
+server.py passes PacketJSON to ``SocketIO(json=...)``. It uses orjson when it
+is installed, and lets handlers wrap a payload in Encoded so it is serialized
+once and spliced verbatim into every packet that carries it (room history
+snapshots, the emote map) instead of being re-encoded for each recipient.
+
+Room broadcasts are already encoded once per emit by python-socketio, whatever
+the room size; this module makes that single encode cheaper.
+"""
+import json
+import os
+
+from engineio import json as engineio_json
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is used otherwise
+    orjson = None
+
+if os.getenv('USE_ORJSON', '1').lower() in ('0', 'false', 'no'):
+    orjson = None
+
+
+def _default(obj):
+    # records (see records.py) turn into their wire dict only here
+    as_dict = getattr(obj, 'as_dict', None)
+    if as_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return as_dict()
+
+
+def dumps(obj):
+    """Compact JSON text for obj."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits; let the stdlib deal with it
+            pass
+    return json.dumps(obj, separators=(',', ':'), default=_default)
+
+
+class Encoded:
+    """A payload serialized once, reusable across any number of emits."""
+
+    __slots__ = ('value', 'text')
+
+    def __init__(self, value):
+        self.value = value
+        self.text = dumps(value)
+
+
+def _has_encoded(obj):
+    if isinstance(obj, Encoded):
+        return True
+    return isinstance(obj, dict) and any(isinstance(v, Encoded) for v in obj.values())
+
+
+def _encode(obj, depth):
+    # Encoded values are spliced in as-is; only the top-level argument list
+    # and the dicts directly inside it are searched for them.
+    if isinstance(obj, Encoded):
+        return obj.text
+    if depth and isinstance(obj, list) and any(_has_encoded(v) for v in obj):
+        return '[' + ','.join(_encode(v, depth - 1) for v in obj) + ']'
+    if depth and isinstance(obj, dict) and _has_encoded(obj):
+        return '{' + ','.join(f"{dumps(str(k))}:{_encode(v, depth - 1)}" for k, v in obj.items()) + '}'
+    return dumps(obj)
+
+
+def plain(obj):
+    """Replace Encoded wrappers and records with plain values (for message queues)."""
+    if isinstance(obj, Encoded):
+        return plain(obj.value)
+    as_dict = getattr(obj, 'as_dict', None)
+    if as_dict is not None:
+        return as_dict()
+    if isinstance(obj, list):
+        return [plain(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(plain(v) for v in obj)
+    if isinstance(obj, dict):
+        return {k: plain(v) for k, v in obj.items()}
+    return obj
+
+
+class PacketJSON:
+    """json-module lookalike for python-socketio / python-engineio."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return _encode(obj, 2)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return engineio_json.loads(s, **kwargs)
+
+
+ENCODER_NAME = 'orjson' if orjson is not None else 'json'
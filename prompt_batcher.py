@@ -0,0 +1,53 @@
+"""Coalescing of LLM prompts for bot_swarm.py.
+
+When a chat message lands, several bots decide to answer it within a moment of
+each other, each with a prompt built around the same recent chat. Prompts that
+share a key (room plus chat context) and are submitted within ``window``
+seconds of the first one are handed to ``flush`` together, so the shared
+context can go to the LM server once. The batch also goes out early once it
+holds ``max_batch`` prompts. ``flush(key, items)`` returns one result per item,
+in order; each submitter gets its own.
+"""
+import asyncio
+
+
+class PromptBatcher:
+    def __init__(self, flush, window, max_batch=8):
+        self.flush = flush
+        self.window = window  # seconds; 0 disables batching
+        self.max_batch = max_batch
+        self.pending = {}  # key -> [(item, future)]
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_batch > 1
+
+    async def submit(self, key, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = []
+            loop.call_later(self.window, self._dispatch, key, batch)
+        batch.append((item, future))
+        if len(batch) >= self.max_batch:
+            self._dispatch(key, batch)
+        return await future
+
+    def _dispatch(self, key, batch):
+        if self.pending.get(key) is not batch:
+            return  # already sent because it filled up
+        del self.pending[key]
+        asyncio.ensure_future(self._run(key, batch))
+
+    async def _run(self, key, batch):
+        try:
+            results = await self.flush(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the bot may have been cancelled meanwhile
+                future.set_result(result)
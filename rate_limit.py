@@ -0,0 +1,82 @@
+"""Token-bucket rate limiting for the Socket.IO handlers in server.py.
+
+A RateLimiter keeps one bucket per key (a socket sid or a room id). Buckets
+refill continuously at ``rate`` tokens per second up to ``burst``; each check
+is a couple of float operations on the key's bucket, so limiting costs O(1)
+per event no matter how many keys are tracked.
+"""
+import time
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Per-key token buckets sharing one rate/burst configuration.
+
+    A rate of 0 disables the limiter (everything is allowed).
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(max(burst, 1))
+        self.clock = clock
+        self.buckets = {}
+        self.allowed = 0
+        self.limited = 0
+
+    def _bucket(self, key):
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def has_tokens(self, key, cost=1.0):
+        """Whether allow() would pass, without taking tokens or counting."""
+        return self.rate <= 0 or self._bucket(key).tokens >= cost
+
+    def take(self, key, cost=1.0):
+        if self.rate > 0:
+            self._bucket(key).tokens -= cost
+        self.allowed += 1
+
+    def allow(self, key, cost=1.0):
+        if self.has_tokens(key, cost):
+            self.take(key, cost)
+            return True
+        self.limited += 1
+        return False
+
+    def forget(self, key):
+        self.buckets.pop(key, None)
+
+    def stats(self):
+        return {'rate': self.rate, 'burst': self.burst, 'allowed': self.allowed,
+                'limited': self.limited, 'keys': len(self.buckets)}
+
+
+def allow_all(checks, cost=1.0, retry=False):
+    """allow() over several ``(limiter, key)`` pairs at once.
+
+    Tokens are only taken when every bucket has them, so a denial by one
+    limiter doesn't use up the others. ``retry=True`` re-checks an event that
+    was already counted as limited, so a denial isn't counted again.
+    """
+    denied = [limiter for limiter, key in checks if not limiter.has_tokens(key, cost)]
+    if denied:
+        if not retry:
+            for limiter in denied:
+                limiter.limited += 1
+        return False
+    for limiter, key in checks:
+        limiter.take(key, cost)
+    return True
@@ -0,0 +1,65 @@
+"""Compact message and session records for server.py.
+
+Room histories hold thousands of messages and the server thousands of
+sessions, so both are ``__slots__`` classes rather than dicts: no per-instance
+``__dict__``, and attribute names are not stored per record. A message only
+becomes a dict at the edges (``as_dict``), where payloads.dumps serializes it
+for a packet, the history database or another worker.
+"""
+
+
+class Message:
+    __slots__ = ('room', 'seq', 'user', 'text', 'timestamp', 'is_bot', 'segments')
+
+    def __init__(self, room, user, text, timestamp, is_bot=False, segments=None, seq=0):
+        self.room = room
+        self.seq = seq
+        self.user = user
+        self.text = text
+        self.timestamp = timestamp
+        self.is_bot = is_bot
+        # None when the message is plain text (the common case), so it costs
+        # nothing here and is left out of the payload; clients show ``text``
+        if segments is not None and len(segments) == 1 and 't' in segments[0]:
+            segments = None
+        self.segments = segments
+
+    @property
+    def id(self):
+        return f"{self.room}:{self.seq}"
+
+    def as_dict(self):
+        """The wire format clients and bots receive."""
+        data = {
+            'user': self.user,
+            'text': self.text,
+            'timestamp': self.timestamp,
+        }
+        if self.segments is not None:
+            data['segments'] = self.segments
+        if self.is_bot:
+            data['is_bot'] = True
+        if self.seq:
+            data['seq'] = self.seq
+            data['id'] = self.id
+        return data
+
+    @classmethod
+    def from_dict(cls, room, data):
+        return cls(room, data.get('user'), data.get('text', ''), data.get('timestamp', 0),
+                   is_bot=data.get('is_bot', False), segments=data.get('segments'),
+                   seq=data.get('seq', 0))
+
+
+class Session:
+    """Per-socket state, keyed by sid in ``user_sessions``."""
+
+    __slots__ = ('user', 'room', 'last_seen', 'system', 'resume_token', 'reaped')
+
+    def __init__(self, last_seen):
+        self.user = None
+        self.room = None
+        self.last_seen = last_seen
+        self.system = ''
+        self.resume_token = None
+        self.reaped = False
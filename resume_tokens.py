@@ -0,0 +1,45 @@
+"""Reconnect resume state for server.py.
+
+Every join hands the client a fresh resume token. When the socket drops the
+user is not removed right away: their (room, user) is parked under the token
+for a grace period. A client that reconnects in time and presents the token
+is put back silently (no ``user_left``/``user_joined`` broadcast) and only
+receives the messages it missed. A parked entry still holds its connection's
+share of the user's presence; entries that are never claimed expire and are
+turned into a normal leave.
+"""
+import secrets
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+class ResumeRegistry:
+    def __init__(self, grace):
+        self.grace = grace  # seconds; 0 disables parking
+        self.parked = {}  # token -> (room_id, user, expires_at)
+
+    @property
+    def enabled(self):
+        return self.grace > 0
+
+    def park(self, token, room_id, user, now):
+        self.parked[token] = (room_id, user, now + self.grace)
+
+    def claim(self, token, room_id, user, now):
+        """True if token parks this exact room/user and hasn't expired."""
+        entry = self.parked.get(token)
+        if entry is None or entry[:2] != (room_id, user) or entry[2] <= now:
+            return False
+        del self.parked[token]
+        return True
+
+    def expired(self, now):
+        """Remove and return ``[(room_id, user)]`` whose grace period is over."""
+        gone = [token for token, (_, _, expires) in self.parked.items() if expires <= now]
+        result = []
+        for token in gone:
+            room_id, user, _ = self.parked.pop(token)
+            result.append((room_id, user))
+        return result
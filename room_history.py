@@ -0,0 +1,122 @@
+"""Per-room chat history for server.py.
+
+Each room keeps a fixed-capacity ring buffer of its latest messages (O(1)
+append, oldest message dropped automatically) plus a cached copy of the
+window sent to joining clients (as a list and as pre-encoded JSON), rebuilt
+only after the history changes.
+
+Messages carry a per-room sequence number (``seq``) that only grows, so the
+buffer stays sorted by it and pages before/since a given seq are found by
+binary search.
+"""
+import os
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import islice
+
+from payloads import Encoded
+
+HISTORY_CAPACITY = int(os.getenv('HISTORY_CAPACITY', 200))
+HISTORY_SNAPSHOT_SIZE = int(os.getenv('HISTORY_SNAPSHOT_SIZE', 50))
+
+
+def parse_room_overrides(spec, cast=int):
+    """Parse ``"lobby=1000,quiet-room=50"`` into ``{'lobby': 1000, ...}``."""
+    overrides = {}
+    for item in (spec or '').split(','):
+        room_id, sep, value = item.rpartition('=')
+        if sep and room_id.strip():
+            overrides[room_id.strip()] = cast(value)
+    return overrides
+
+
+# Per-room overrides of HISTORY_CAPACITY
+ROOM_HISTORY_CAPACITIES = parse_room_overrides(os.getenv('ROOM_HISTORY_CAPACITIES'))
+
+
+def capacity_for(room_id):
+    return ROOM_HISTORY_CAPACITIES.get(room_id, HISTORY_CAPACITY)
+
+
+def message_seq(message):
+    return message.seq
+
+
+class RoomHistory:
+    """Ring buffer of a room's most recent messages."""
+
+    __slots__ = ('_messages', '_snapshot', '_encoded', 'snapshot_size', 'last_seq')
+
+    def __init__(self, capacity=HISTORY_CAPACITY, snapshot_size=HISTORY_SNAPSHOT_SIZE):
+        self._messages = deque(maxlen=capacity)
+        self._snapshot = None
+        self._encoded = None
+        self.snapshot_size = snapshot_size
+        self.last_seq = 0
+
+    @property
+    def capacity(self):
+        return self._messages.maxlen
+
+    def next_seq(self):
+        """Allocate the sequence number for a new message in this room."""
+        self.last_seq += 1
+        return self.last_seq
+
+    def append(self, message):
+        seq = message_seq(message)
+        if seq >= self.last_seq or not self._messages:
+            self._messages.append(message)
+        else:
+            # replicated from another worker after a newer local message:
+            # keep the buffer sorted by seq
+            i = bisect_right(self._messages, seq, key=message_seq)
+            if len(self._messages) == self._messages.maxlen:
+                if i == 0:
+                    return
+                self._messages.popleft()
+                i -= 1
+            self._messages.insert(i, message)
+        self.last_seq = max(self.last_seq, seq)
+        self._snapshot = None
+        self._encoded = None
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    @property
+    def oldest_seq(self):
+        return message_seq(self._messages[0]) if self._messages else self.last_seq + 1
+
+    def since(self, seq, limit):
+        """Up to ``limit`` messages with a seq above ``seq``, oldest first."""
+        i = bisect_right(self._messages, seq, key=message_seq)
+        return list(islice(self._messages, i, i + limit))
+
+    def before(self, seq, limit):
+        """Up to ``limit`` messages with a seq below ``seq``, oldest first."""
+        i = bisect_left(self._messages, seq, key=message_seq)
+        return list(islice(self._messages, max(i - limit, 0), i))
+
+    def recent(self):
+        """The last ``snapshot_size`` messages, cached until the next append.
+
+        Callers share the returned list and must not mutate it.
+        """
+        if self._snapshot is None:
+            newest_first = islice(reversed(self._messages), self.snapshot_size)
+            self._snapshot = list(newest_first)[::-1]
+        return self._snapshot
+
+    def recent_encoded(self):
+        """recent(), serialized once for every joiner until the next append."""
+        if self._encoded is None:
+            self._encoded = Encoded(self.recent())
+        return self._encoded
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
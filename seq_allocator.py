@@ -0,0 +1,136 @@
+"""Cluster-wide message sequence numbers for server.py.
+
+A single worker numbers a room's messages from its own RoomHistory. With
+several workers, two of them could hand out the same seq for the same room,
+so message ids would stop being unique and seq paging would become ambiguous.
+In multi-worker mode each seq is therefore taken from a counter every worker
+shares, picked by ``SEQ_COUNTER`` (default: the queue itself when it is
+``redis://`` or ``local://``):
+
+- ``redis://...``: one Redis key per room, bumped by a tiny Lua script. This
+  is the only counter that works across nodes;
+- ``sqlite:///path``: a ``room_seqs`` table in a SQLite file, for workers on
+  one host. Each worker reserves a block of seqs per round trip and hands
+  them out from memory;
+- ``local://``: a counter shared by every server in the interpreter.
+
+``allocate(room_id, floor)`` returns a seq above ``floor``, the highest seq
+this worker has seen for the room, and one no other worker was or will be
+given. That way a counter that starts empty (or was lost) carries on after
+history restored from the database.
+"""
+import os
+import sqlite3
+import threading
+
+# seqs a SQLiteSeqs worker reserves per room and round trip
+SEQ_BLOCK = int(os.getenv('SEQ_BLOCK', 32))
+
+SEQ_TABLE = """
+CREATE TABLE IF NOT EXISTS room_seqs (
+    room TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+# KEYS[1] = counter, ARGV[1] = floor
+REDIS_ALLOCATE = """
+local seq = redis.call('INCR', KEYS[1])
+local floor = tonumber(ARGV[1])
+if seq <= floor then
+    seq = floor + 1
+    redis.call('SET', KEYS[1], seq)
+end
+return seq
+"""
+
+
+def _run_inline(fn, *args):
+    return fn(*args)
+
+
+class SharedCounterSeqs:
+    """Counters shared by every server in this process (``local://`` queues)."""
+
+    _counters = {}  # (channel, room_id) -> last seq
+    _lock = threading.Lock()
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def allocate(self, room_id, floor):
+        key = (self.channel, room_id)
+        with self._lock:
+            seq = self._counters[key] = max(self._counters.get(key, 0), floor) + 1
+        return seq
+
+
+class RedisSeqs:
+    def __init__(self, url, channel):
+        import redis
+        self.prefix = f"{channel}:seq:"
+        self._allocate = redis.Redis.from_url(url).register_script(REDIS_ALLOCATE)
+
+    def allocate(self, room_id, floor):
+        return int(self._allocate(keys=[self.prefix + room_id], args=[floor]))
+
+
+class SQLiteSeqs:
+    """Block-reserving counter in a SQLite file shared by workers on one host.
+
+    Blocks of different workers never overlap, but a worker's seqs are only
+    ordered against the messages it has seen: once ``floor`` passes its block
+    (another worker went ahead), the rest of the block is abandoned and a
+    fresh one is reserved above ``floor``.
+    """
+
+    def __init__(self, path, block=SEQ_BLOCK, offload=_run_inline):
+        self.block = max(block, 1)
+        self.offload = offload
+        self.blocks = {}  # room_id -> [next seq, last seq of the block]
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # a lost reservation after a power cut only skips seqs, never repeats them
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self.db.executescript(SEQ_TABLE)
+        self._lock = threading.Lock()
+
+    def _reserve(self, room_id, floor):
+        # one statement, so the bump is atomic across processes
+        # fetchall: the autocommit only happens once the RETURNING rows are consumed
+        [(last,)] = self.db.execute(
+            'INSERT INTO room_seqs (room, seq) VALUES (?, ? + ?) '
+            'ON CONFLICT (room) DO UPDATE SET seq = max(seq, ?) + ? '
+            'RETURNING seq', (room_id, floor, self.block, floor, self.block)).fetchall()
+        return last
+
+    def allocate(self, room_id, floor):
+        with self._lock:
+            block = self.blocks.get(room_id)
+            if block is None or block[0] > block[1] or block[0] <= floor:
+                last = self.offload(self._reserve, room_id, floor)
+                block = self.blocks[room_id] = [last - self.block + 1, last]
+            seq = block[0]
+            block[0] += 1
+        return seq
+
+
+def create_seq_allocator(queue_url, channel, counter_url=None, offload=_run_inline):
+    """The shared counter for a cluster on ``queue_url``.
+
+    ``counter_url`` (SEQ_COUNTER) defaults to the queue when that is
+    ``redis://`` or ``local://``. Raises ValueError when there is no counter
+    every worker can reach.
+    """
+    if not counter_url and queue_url.startswith(('redis://', 'rediss://', 'local://')):
+        counter_url = queue_url
+    counter_url = counter_url or ''
+    if counter_url.startswith(('redis://', 'rediss://')):
+        return RedisSeqs(counter_url, channel)
+    if counter_url.startswith('sqlite://'):
+        return SQLiteSeqs(counter_url[len('sqlite://'):], offload=offload)
+    if counter_url.startswith('local://'):
+        return SharedCounterSeqs(channel)
+    raise ValueError(f"multi-worker mode over {queue_url.split(':', 1)[0]}:// needs SEQ_COUNTER: "
+                     "a redis:// URL, or sqlite:///<file> when all workers run on one host")
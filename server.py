@@ -1,33 +1,573 @@
-from flask import Flask, render_template, request, send_from_directory, jsonify
+import os
+
+# Serving mode. 'threading' runs on Werkzeug with one OS thread per websocket
+# and is only meant for local development. 'gevent' and 'eventlet' run the same
+# handlers on cooperative I/O; they must patch the stdlib before anything else
+# imports socket/threading, so this has to stay at the very top of the module.
+ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading').lower()
+async_mode_error = None
+try:
+    if ASYNC_MODE == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif ASYNC_MODE == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+except ImportError as e:
+    async_mode_error = e
+    ASYNC_MODE = 'threading'
+
+from flask import Flask, abort, render_template, request, send_file, send_from_directory
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from engineio import packet as eio_packet
 from flask_cors import CORS
-import json
-import os
+import atexit
+import functools
+import logging
 import time
 import random
+from collections import Counter, defaultdict
+import signal
+import sys
+
+from log_setup import MESSAGE_LOGGER, configure_logging
+from cluster import create_client_manager
+from room_history import (HISTORY_SNAPSHOT_SIZE, RoomHistory, capacity_for, message_seq,
+                          parse_room_overrides)
+from payloads import ENCODER_NAME, Encoded, PacketJSON, dumps
+from emote_registry import EmoteRegistry
+from emote_assets import AssetIndex
+from rate_limit import RateLimiter, allow_all
+from typing_tracker import TypingTracker
+from message_batcher import MessageBatcher
+from history_store import HistoryStore
+from resume_tokens import ResumeRegistry, new_token
+from seq_allocator import create_seq_allocator
+from records import Message, Session
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, SIZE_BUCKETS
+
+configure_logging()
+log = logging.getLogger('server')
+# sampled, see LOG_MESSAGE_SAMPLE
+message_log = logging.getLogger(MESSAGE_LOGGER)
+if async_mode_error:
+    log.warning("ASYNC_MODE unavailable (%s); falling back to threading", async_mode_error)
+
+# Rough number of concurrent websockets one server process (= one core, the
+# GIL keeps a process on a single core) can hold before latency degrades.
+# Threading burns an OS thread + stack per socket; the cooperative modes only
+# cost a greenlet and the socket buffers. See README "Serving modes".
+CONNECTIONS_PER_CORE = {
+    'threading': 300,
+    'gevent': 5000,
+    'eventlet': 5000,
+}
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS') or CONNECTIONS_PER_CORE.get(ASYNC_MODE, 300))
 
 app = Flask(__name__)
 CORS(app, origins="*")
 
-# Use threading for Python 3.13 compatibility
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Multi-worker mode: run N server processes behind a sticky load balancer and
+# point them all at the same MESSAGE_QUEUE (redis://..., amqp://..., or
+# local:// between servers loaded into one interpreter). Emits and room state
+# are shared through it, see cluster.py.
+MESSAGE_QUEUE = os.getenv('MESSAGE_QUEUE')
+MESSAGE_QUEUE_CHANNEL = os.getenv('MESSAGE_QUEUE_CHANNEL', 'flask-socketio')
+cluster_manager = None
+socketio_options = {}
+if MESSAGE_QUEUE:
+    cluster_manager = create_client_manager(MESSAGE_QUEUE, channel=MESSAGE_QUEUE_CHANNEL)
+    socketio_options['client_manager'] = cluster_manager
+
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    json=PacketJSON, **socketio_options)
 
 # Global state
-rooms = {}  # room_id -> {users: set(), messages: list()}
-user_sessions = {}  # sid -> {user: str, room: str, last_seen: float}
-EMOTE_MAP = {}
+# room_id -> {users: Counter(user -> open connections), messages: RoomHistory,
+#            last_active: float}
+rooms = {}
+user_sessions = {}  # sid -> Session
+# Multi-worker mode: host_id -> Counter((room_id, user) -> connections) held on
+# that worker, so the members of a worker that stops heartbeating can be removed
+cluster_members = defaultdict(Counter)
+peer_heartbeats = {}  # host_id -> time of the worker's last state op
+
+# Hot-path metrics, exported at /metrics (gauges are registered next to it)
+metrics = Registry(prefix='chat_')
+handler_seconds = metrics.histogram(
+    'handler_seconds', 'Socket.IO handler latency in seconds', labels=('event',))
+broadcast_recipients = metrics.histogram(
+    'broadcast_recipients', 'Local sockets reached per room broadcast',
+    labels=('event',), buckets=SIZE_BUCKETS)
+emitted_bytes = metrics.counter(
+    'emitted_bytes_total', 'Socket.IO packet bytes sent to this worker\'s sockets',
+    labels=('event',))
+
+
+def timed(event):
+    """Record the wrapped handler's latency under ``event``."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            started = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, event)
+        return wrapper
+    return decorator
+
+
+def packet_event(data):
+    """Event name of an encoded Socket.IO packet ('other' for non-events)."""
+    if not isinstance(data, str) or not data.startswith('2'):
+        return 'other'
+    start = data.find('["') + 2
+    end = data.find('"', start)
+    return data[start:end] if start > 1 and end > 0 else 'other'
+
+
+def count_emitted(send_packet):
+    """Wrap engine.io's send_packet to count bytes per event.
+
+    Every outgoing packet goes through it: broadcasts, direct emits, history
+    and resume replays. A broadcast hands the same packet to each recipient
+    in turn, so its size is only computed once.
+    """
+    last = (None, 0, None)
+
+    @functools.wraps(send_packet)
+    def wrapper(sid, pkt):
+        nonlocal last
+        if pkt.packet_type == eio_packet.MESSAGE:
+            cached = last
+            if cached[0] is not pkt:
+                data = pkt.data
+                size = len(data) if isinstance(data, bytes) or data.isascii() else len(data.encode())
+                cached = last = (pkt, size, packet_event(data))
+            emitted_bytes.inc(cached[2], amount=cached[1])
+        return send_packet(sid, pkt)
+    return wrapper
+
+
+socketio.server.eio.send_packet = count_emitted(socketio.server.eio.send_packet)
+
+
+def broadcast(event, payload, room_id, **kwargs):
+    """Emit payload to a room, encoding it once and counting the fan-out."""
+    payload = Encoded(payload)
+    namespace = socketio.server.manager.rooms.get('/', {})
+    recipients = len(namespace.get(room_id, ()))
+    socketio.emit(event, payload, to=room_id, **kwargs)
+    broadcast_recipients.observe(recipients, event)
+
+
+def ensure_room(room_id):
+    room = rooms.get(room_id)
+    if room is None:
+        history = RoomHistory(capacity_for(room_id))
+        history.last_seq = dropped_room_seqs.pop(room_id, 0)
+        if history_store is not None:
+            # loaded on first use, so a pruned (or restarted) room picks up
+            # where it left off and startup doesn't scale with the room count
+            history.extend(history_store.recent(room_id, history.capacity))
+        room = rooms[room_id] = {'users': Counter(), 'messages': history,
+                                 'last_active': time.time()}
+    return room
+
+
+def add_room_user(room_id, user, host_id=None):
+    """Count one more connection of user (held by worker host_id, default this
+    one); returns True if it is their first."""
+    if cluster_manager is not None:
+        cluster_members[host_id or cluster_manager.host_id][(room_id, user)] += 1
+    users = ensure_room(room_id)['users']
+    users[user] += 1
+    return users[user] == 1
+
+
+def remove_room_user(room_id, user, host_id=None):
+    """Drop one connection of user; returns True if that was their last."""
+    if cluster_manager is not None:
+        members = cluster_members[host_id or cluster_manager.host_id]
+        key = (room_id, user)
+        if not members[key]:
+            return False  # already removed with its expired worker
+        members[key] -= 1
+        if not members[key]:
+            del members[key]
+    room = rooms.get(room_id)
+    if room and user in room['users']:
+        room['last_active'] = time.time()
+        room['users'][user] -= 1
+        if room['users'][user] <= 0:
+            del room['users'][user]
+            return True
+    return False
+
+
+def store_message(room_id, message):
+    if room_id in rooms:
+        rooms[room_id]['messages'].append(message)
+        rooms[room_id]['last_active'] = time.time()
+
+
+# Inbound rate limits (token buckets, see rate_limit.py). Rates are events per
+# second and 0 disables a limiter. RATE_LIMIT_MODE=drop discards over-limit
+# messages; coalesce keeps each socket's latest over-limit message and sends it
+# once its buckets have refilled.
+RATE_LIMIT_MODE = os.getenv('RATE_LIMIT_MODE', 'drop').lower()
+COALESCE_FLUSH_INTERVAL = float(os.getenv('COALESCE_FLUSH_INTERVAL', 0.25))
+sid_message_limiter = RateLimiter(float(os.getenv('SID_MESSAGE_RATE', 2)), float(os.getenv('SID_MESSAGE_BURST', 5)))
+room_message_limiter = RateLimiter(float(os.getenv('ROOM_MESSAGE_RATE', 50)), float(os.getenv('ROOM_MESSAGE_BURST', 100)))
+sid_typing_limiter = RateLimiter(float(os.getenv('SID_TYPING_RATE', 2)), float(os.getenv('SID_TYPING_BURST', 4)))
+coalesced_messages = {}  # sid -> (room_id, message) waiting for tokens
+rate_limit_counters = {'dropped': 0, 'coalesced': 0}
+
+
+def message_allowed(sid, room_id, retry=False):
+    """Check the sid and room budgets together; tokens are only spent if both pass.
+
+    Rooms that don't exist aren't room-limited, so made-up room names can't
+    grow the room limiter's buckets.
+    """
+    checks = [(sid_message_limiter, sid)]
+    if room_id in rooms:
+        checks.append((room_message_limiter, room_id))
+    return allow_all(checks, retry=retry)
+
+
+# Optional micro-batching of broadcasts: messages accepted within
+# MESSAGE_BATCH_WINDOW_MS go out as one `messages` frame (0 = send each one
+# immediately). ROOM_BATCH_WINDOWS_MS overrides the window per room.
+message_batcher = MessageBatcher(
+    window=float(os.getenv('MESSAGE_BATCH_WINDOW_MS', 0)) / 1000,
+    room_windows={room_id: ms / 1000 for room_id, ms in
+                  parse_room_overrides(os.getenv('ROOM_BATCH_WINDOWS_MS'), float).items()},
+    max_batch=int(os.getenv('MESSAGE_BATCH_MAX', 50)),
+)
+
+
+# Optional durable history: HISTORY_DB is a SQLite file written in batches
+# every HISTORY_FLUSH_INTERVAL seconds. A room gets back its newest messages
+# (up to its history capacity) when it is first used, not at startup.
+HISTORY_DB = os.getenv('HISTORY_DB')
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 0.25))
+
+
+def run_blocking(fn, *args):
+    """Run a blocking call on a native thread when the server is cooperative."""
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+history_store = None
+if HISTORY_DB:
+    history_store = HistoryStore(HISTORY_DB, offload=run_blocking)
+    log.info("Room history is kept in %s", HISTORY_DB)
+
+# In multi-worker mode every message seq comes from a counter all workers
+# share (see seq_allocator.py), so ids stay unique across the cluster.
+# SEQ_COUNTER is redis://... (any deployment) or sqlite:///<file> (one host);
+# it defaults to the queue when that is redis:// or local://
+seq_allocator = None
+if cluster_manager is not None:
+    seq_allocator = create_seq_allocator(MESSAGE_QUEUE, MESSAGE_QUEUE_CHANNEL, os.getenv('SEQ_COUNTER'),
+                                         offload=run_blocking)
+
+
+def next_seq(room_id):
+    history = rooms[room_id]['messages']
+    if seq_allocator is None:
+        return history.next_seq()
+    return seq_allocator.allocate(room_id, history.last_seq)
+
+
+def exit_on_sigterm(signum, frame):
+    # docker stop sends SIGTERM; exit normally so atexit flushes the history
+    # queue, and ignore repeats so the flush itself isn't interrupted
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+
+def persist_history():
+    while True:
+        socketio.sleep(HISTORY_FLUSH_INTERVAL)
+        try:
+            history_store.flush()
+        except Exception:
+            log.exception("Error writing history to %s", HISTORY_DB)
+
+
+def deliver_message(room_id, message):
+    """Store a chat message and fan it out to the room."""
+    if room_id in rooms:
+        message.seq = next_seq(room_id)
+        store_message(room_id, message)
+        publish_state('message', room=room_id, message=message.as_dict())
+        # only the accepting worker persists; the others got it via the queue
+        if history_store is not None:
+            history_store.append(room_id, message)
+    window = message_batcher.window_for(room_id)
+    if window > 0:
+        batch, opened = message_batcher.add(room_id, message)
+        if opened:
+            socketio.start_background_task(send_batch_later, room_id, batch, window)
+        if message_batcher.full(batch) and message_batcher.take(room_id, batch):
+            broadcast('messages', {'messages': batch}, room_id)
+        return
+    broadcast('message', message, room_id)
+
+
+def send_batch_later(room_id, batch, window):
+    """Send a batch when its window ends, unless it filled up first."""
+    socketio.sleep(window)
+    if message_batcher.take(room_id, batch):
+        broadcast('messages', {'messages': batch}, room_id)
+
+
+def build_message(room_id, user, text, **kwargs):
+    # emotes are pre-tokenized so viewers don't each have to scan the text
+    return Message(room_id, user, text, time.time(),
+                   segments=emote_registry.current.tokenize(text), **kwargs)
+
+
+def limit_message(sid, room_id, user, text, **kwargs):
+    """Handle a message that exceeded its sid or room budget.
+
+    Only coalesce mode builds the Message; a dropped one is never tokenized.
+    """
+    if RATE_LIMIT_MODE == 'coalesce':
+        if sid in coalesced_messages:
+            rate_limit_counters['coalesced'] += 1
+        coalesced_messages[sid] = (room_id, build_message(room_id, user, text, **kwargs))
+    else:
+        rate_limit_counters['dropped'] += 1
+        emit('rate_limited', {'event': 'message'})
+
+
+def flush_coalesced_messages():
+    while True:
+        socketio.sleep(COALESCE_FLUSH_INTERVAL)
+        for sid, (room_id, message) in list(coalesced_messages.items()):
+            if message_allowed(sid, room_id, retry=True):
+                del coalesced_messages[sid]
+                deliver_message(room_id, message)
+
+
+# Typing indicators are batched: one typing_users list per room every
+# TYPING_BROADCAST_INTERVAL seconds, only when it changed
+TYPING_BROADCAST_INTERVAL = float(os.getenv('TYPING_BROADCAST_INTERVAL', 0.5))
+typing_tracker = TypingTracker(ttl=float(os.getenv('TYPING_TTL', 3.0)))
+
+
+def broadcast_typing():
+    while True:
+        socketio.sleep(TYPING_BROADCAST_INTERVAL)
+        for room_id, users in typing_tracker.changes(time.time()):
+            # every worker tracks all typers (replicated), so each one only
+            # needs to reach its own clients
+            broadcast('typing_users', {'users': list(users)}, room_id, ignore_queue=True)
+
+
+# Reconnect resume: a dropped socket keeps its user in the room for
+# RESUME_GRACE seconds; reconnecting with the resume token from `joined`
+# skips the presence broadcasts and the full history resend (0 = off)
+resume_registry = ResumeRegistry(grace=float(os.getenv('RESUME_GRACE', 30)))
+
+
+def leave_room_state(room_id, user):
+    """Remove user from room_id everywhere and tell the room."""
+    # every connection is replicated, or other workers' counts would drift
+    publish_state('leave', room=room_id, user=user)
+    if remove_room_user(room_id, user):
+        socketio.emit('user_left', {'user': user}, to=room_id)
+        log.info("User %s left room %s", user, room_id)
+
+
+def expire_resume_tokens():
+    while True:
+        socketio.sleep(1)
+        for room_id, user in resume_registry.expired(time.time()):
+            leave_room_state(room_id, user)
+
+
+# Presence housekeeping. Sockets that sent nothing (not even the clients'
+# periodic `ping`) for SESSION_IDLE_TIMEOUT seconds are disconnected, and rooms
+# nobody is in are dropped after EMPTY_ROOM_TTL seconds; their history comes
+# back from HISTORY_DB if the room is used again. 0 disables either.
+SESSION_IDLE_TIMEOUT = float(os.getenv('SESSION_IDLE_TIMEOUT', 600))
+EMPTY_ROOM_TTL = float(os.getenv('EMPTY_ROOM_TTL', 300))
+PRESENCE_REAP_INTERVAL = float(os.getenv('PRESENCE_REAP_INTERVAL', 30))
+reaped = metrics.counter('reaped_total', 'Idle sessions and empty rooms removed', labels=('kind',))
+# room_id -> last seq of a dropped room, so a room that comes back carries on
+# numbering instead of reusing ids (matters without HISTORY_DB)
+dropped_room_seqs = {}
+
+
+def reap_presence():
+    while True:
+        socketio.sleep(PRESENCE_REAP_INTERVAL)
+        now = time.time()
+        if SESSION_IDLE_TIMEOUT > 0:
+            for sid, session in list(user_sessions.items()):
+                if now - session.last_seen > SESSION_IDLE_TIMEOUT:
+                    # an idle client isn't coming back; skip the resume grace
+                    session.reaped = True
+                    socketio.server.disconnect(sid)
+                    reaped.inc('session')
+        if EMPTY_ROOM_TTL > 0:
+            for room_id, room in list(rooms.items()):
+                if not room['users'] and now - room['last_active'] > EMPTY_ROOM_TTL:
+                    del rooms[room_id]
+                    if room['messages'].last_seq:
+                        dropped_room_seqs[room_id] = room['messages'].last_seq
+                    room_message_limiter.forget(room_id)
+                    reaped.inc('room')
+
+
+def publish_state(op, **fields):
+    """Replicate a room state change to the other workers, if clustered."""
+    if cluster_manager is not None:
+        cluster_manager.publish_state(op, **fields)
+
+
+def apply_cluster_state(data):
+    """Apply a state op published by another worker to the local replica."""
+    op = data.get('op')
+    peer_heartbeats[data['host_id']] = time.time()
+    if op == 'join':
+        add_room_user(data['room'], data['user'], data['host_id'])
+    elif op == 'leave':
+        remove_room_user(data['room'], data['user'], data['host_id'])
+    elif op == 'message':
+        ensure_room(data['room'])
+        store_message(data['room'], Message.from_dict(data['room'], data['message']))
+    elif op == 'typing':
+        if data['active']:
+            typing_tracker.start(data['room'], data['user'], time.time())
+        else:
+            typing_tracker.stop(data['room'], data['user'])
+    elif op == 'hello':
+        # A worker just started: hand it our view of every room
+        publish_state('snapshot', to=data['host_id'], rooms={
+            room_id: [message.as_dict() for message in room['messages']]
+            for room_id, room in rooms.items()
+        }, members={
+            host_id: [[room_id, user, connections] for (room_id, user), connections in members.items()]
+            for host_id, members in cluster_members.items()
+        })
+    elif op == 'snapshot' and data.get('to') == cluster_manager.host_id:
+        for room_id, messages in data['rooms'].items():
+            room = ensure_room(room_id)
+            if not room['messages']:
+                room['messages'].extend(Message.from_dict(room_id, message) for message in messages)
+        # every peer sends the same members; only add what is still missing
+        for host_id, members in data['members'].items():
+            if host_id == cluster_manager.host_id:
+                continue
+            peer_heartbeats.setdefault(host_id, time.time())
+            for room_id, user, connections in members:
+                for _ in range(connections - cluster_members[host_id][(room_id, user)]):
+                    add_room_user(room_id, user, host_id)
+
+
+# Workers publish a heartbeat every CLUSTER_HEARTBEAT_INTERVAL seconds; one that
+# is silent for CLUSTER_PEER_TIMEOUT seconds (crashed, killed, partitioned) has
+# its members removed from every room on the others
+CLUSTER_HEARTBEAT_INTERVAL = float(os.getenv('CLUSTER_HEARTBEAT_INTERVAL', 5))
+CLUSTER_PEER_TIMEOUT = float(os.getenv('CLUSTER_PEER_TIMEOUT', 15))
+
+
+def expire_peer(host_id):
+    """Remove the members held by a worker that stopped heartbeating."""
+    del peer_heartbeats[host_id]
+    members = list(cluster_members.get(host_id, Counter()).items())
+    for (room_id, user), connections in members:
+        for _ in range(connections):
+            if remove_room_user(room_id, user, host_id):
+                typing_tracker.stop(room_id, user)
+                # every worker expires the peer itself, so only tell local clients
+                socketio.emit('user_left', {'user': user}, to=room_id, ignore_queue=True)
+    cluster_members.pop(host_id, None)
+    log.warning("Worker %s stopped heartbeating; removed its %d members",
+                host_id, sum(connections for _, connections in members))
+
+
+def cluster_heartbeat():
+    while True:
+        socketio.sleep(CLUSTER_HEARTBEAT_INTERVAL)
+        publish_state('heartbeat')
+        now = time.time()
+        for host_id, seen in list(peer_heartbeats.items()):
+            if now - seen > CLUSTER_PEER_TIMEOUT:
+                expire_peer(host_id)
+
+
+def start_cluster():
+    """Start listening on the message queue before the first client connects.
+
+    python-socketio only initializes its client manager on the first
+    connection, which would leave an idle worker deaf to state ops.
+    """
+    if cluster_manager is None:
+        return
+    cluster_manager.state_handler = apply_cluster_state
+    if not socketio.server.manager_initialized:
+        socketio.server.manager_initialized = True
+        cluster_manager.initialize()
+
+    def announce():
+        # give the listener a moment to subscribe before asking for snapshots
+        socketio.sleep(1)
+        publish_state('hello')
+
+    socketio.start_background_task(announce)
+    socketio.start_background_task(cluster_heartbeat)
+    log.info("Cluster mode: sharing rooms via %s (host %s)", MESSAGE_QUEUE, cluster_manager.host_id)
+
+# Emote images are indexed (size + content hash) at startup so the map can
+# hand out immutable, content-hashed URLs. EMOTES_ASSET_INDEX=0 skips the
+# hashing and serves the directory as-is.
+EMOTES_DIR = os.path.join(os.path.dirname(__file__), 'emotes')
+emote_assets = None
+if os.getenv('EMOTES_ASSET_INDEX', '1').lower() not in ('0', 'false', 'no'):
+    emote_assets = AssetIndex(EMOTES_DIR)
+
+# Behind nginx/Apache, let the front end stream emote files itself
+app.config['USE_X_SENDFILE'] = os.getenv('EMOTES_X_SENDFILE', '0').lower() in ('1', 'true', 'yes')
 
 # Load emote map if available
+emote_registry = EmoteRegistry(os.path.join(EMOTES_DIR, 'emotes.json'), assets=emote_assets)
 try:
-    emotes_path = os.path.join(os.path.dirname(__file__), 'emotes', 'emotes.json')
-    if os.path.exists(emotes_path):
-        with open(emotes_path, 'r', encoding='utf-8') as f:
-            EMOTE_MAP = json.load(f)
-            print(f"Loaded {len(EMOTE_MAP)} emotes from emotes/emotes.json")
-    else:
-        print("No emotes/emotes.json found; clients will receive empty emote map")
-except Exception as e:
-    print(f"Error loading emote map: {e}")
+    emote_registry.load()
+except Exception:
+    log.exception("Error loading emote map")
+
+# Seconds between checks of emotes/emotes.json for edits (0 disables reloading)
+EMOTES_POLL_INTERVAL = float(os.getenv('EMOTES_POLL_INTERVAL', 2.0))
+
+
+def watch_emotes():
+    """Hot-reload emotes.json and push only the changed entries to clients."""
+    while True:
+        socketio.sleep(EMOTES_POLL_INTERVAL)
+        try:
+            # stat, parse and hash on a native thread, not the event loop
+            delta = run_blocking(emote_registry.reload_if_changed)
+        except Exception:
+            log.exception("Error reloading emote map")
+            continue
+        if delta:
+            log.info("Emote map now version %s: +%d -%d",
+                     delta['version'], len(delta['added']), len(delta['removed']))
+            # every worker watches the file itself, so keep this off the queue
+            socketio.emit('emotes_delta', delta, ignore_queue=True)
 
 @app.route('/')
 def index():
@@ -41,61 +581,94 @@ def index():
     return send_from_directory(root, 'index.html')
 
 
-# Serve emote image files from the emotes directory
+# Serve emote image files from the emotes directory. send_file handles
+# If-None-Match/If-Modified-Since (304) and Range requests, and streams through
+# wsgi.file_wrapper (sendfile) when the WSGI server provides one.
 @app.route('/emotes/<path:filename>')
 def emote_file(filename):
-    emotes_dir = os.path.join(os.path.dirname(__file__), 'emotes')
-    return send_from_directory(emotes_dir, filename)
+    if emote_assets is None:
+        return send_from_directory(EMOTES_DIR, filename, conditional=True)
+    asset = emote_assets.lookup(filename)
+    if asset is None:
+        abort(404)
+    hashed = request.args.get('h') == asset.digest
+    response = send_file(asset.path, conditional=True, etag=asset.digest,
+                         last_modified=asset.mtime, max_age=31536000 if hashed else 0)
+    if hashed:
+        # content-hashed URL: a different file always gets a different URL
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 
-# Provide the emote mapping as JSON at a stable URL for debugging
+# Provide the emote mapping as JSON; clients fetch it once per version and
+# revalidate with If-None-Match
 @app.route('/emotes.json')
 def emote_map():
-    # Debug: log request info to help diagnose external 404s
-    try:
-        print('emote_map request:', request.method, request.path, dict(request.headers))
-    except Exception:
-        pass
-    return jsonify(EMOTE_MAP)
+    current = emote_registry.current
+    if 'gzip' in request.accept_encodings:
+        response = app.response_class(current.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(current.version + '-gz')
+    else:
+        response = app.response_class(current.body, mimetype='application/json')
+        response.set_etag(current.version)
+    response.vary.add('Accept-Encoding')
+    if request.args.get('v') == current.version:
+        # versioned URL: the content behind it can never change
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @socketio.on('connect')
 def handle_connect():
-    print(f"Client connected: {request.sid}")
-    user_sessions[request.sid] = {
-        'user': None,
-        'room': None,
-        'last_seen': time.time()
-    }
-    # Send emote mapping to client so it can render emotes
+    if MAX_CONNECTIONS and len(user_sessions) >= MAX_CONNECTIONS:
+        log.warning("Rejecting %s: connection ceiling %d reached", request.sid, MAX_CONNECTIONS)
+        raise ConnectionRefusedError('server full')
+    log.debug("Client connected: %s", request.sid)
+    user_sessions[request.sid] = Session(time.time())
+    # Tell the client which emote map is current; it fetches /emotes.json
+    # only when its cached copy is stale
     try:
-        emit('emotes', EMOTE_MAP)
+        emit('emotes_version', emote_registry.version_info())
     except Exception:
         # emit may not be available in some contexts; ignore failures
         pass
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print(f"Client disconnected: {request.sid}")
+    log.debug("Client disconnected: %s", request.sid)
     session = user_sessions.get(request.sid)
-    if session and session['room'] and session['user']:
-        room_id = session['room']
-        user = session['user']
-        if room_id in rooms and user in rooms[room_id]['users']:
-            rooms[room_id]['users'].remove(user)
-            emit('user_left', {'user': user}, room=room_id)
-            print(f"User {user} left room {room_id}")
+    if session and session.room and session.user:
+        room_id = session.room
+        user = session.user
+        typing_tracker.stop(room_id, user)
+        publish_state('typing', room=room_id, user=user, active=False)
+        if resume_registry.enabled and session.resume_token and not session.reaped:
+            resume_registry.park(session.resume_token, room_id, user, time.time())
+        else:
+            leave_room_state(room_id, user)
     if request.sid in user_sessions:
         del user_sessions[request.sid]
+    sid_message_limiter.forget(request.sid)
+    sid_typing_limiter.forget(request.sid)
+    coalesced_messages.pop(request.sid, None)
 
 @socketio.on('start')
 def handle_start(data):
     """Initialize session"""
     sid = data.get('sid')
     system = data.get('system', '')
-    user_sessions[request.sid]['system'] = system
-    print(f"Session started for {request.sid}: {system}")
+    user_sessions[request.sid].system = system
+    log.debug("Session started for %s: %s", request.sid, system)
 
 @socketio.on('join')
+@timed('join')
 def handle_join(data):
     room_id = data.get('room')
     user = data.get('user')
@@ -104,31 +677,47 @@ def handle_join(data):
         emit('error', {'message': 'Room and user required'})
         return
 
-    # Leave current room if any
     session = user_sessions.get(request.sid)
-    if session and session['room']:
-        old_room = session['room']
-        if old_room in rooms and session['user'] in rooms[old_room]['users']:
-            rooms[old_room]['users'].remove(session['user'])
-            emit('user_left', {'user': session['user']}, room=old_room)
+    resume = data.get('resume')
+    if resume and session and not session.room \
+            and resume_registry.claim(resume, room_id, user, time.time()):
+        # Reconnect within the grace period: the room never saw us leave, so
+        # just reattach and send what was missed
+        join_room(room_id)
+        session.user = user
+        session.room = room_id
+        session.last_seen = time.time()
+        session.resume_token = new_token()
+        try:
+            since = int(data.get('since') or 0)
+        except (TypeError, ValueError):
+            since = 0
+        emit('resumed', {**history_page(room_id, since=since),
+                         'users': list(ensure_room(room_id)['users']),
+                         'resume_token': session.resume_token})
+        log.debug("User %s resumed in room %s", user, room_id)
+        return
+
+    # Leave current room if any
+    if session and session.room:
+        leave_room_state(session.room, session.user)
 
     # Join new room
     join_room(room_id)
     session = user_sessions[request.sid]
-    session['user'] = user
-    session['room'] = room_id
-    session['last_seen'] = time.time()
+    session.user = user
+    session.room = room_id
+    session.last_seen = time.time()
+    session.resume_token = new_token()
 
-    # Initialize room if needed
-    if room_id not in rooms:
-        rooms[room_id] = {'users': set(), 'messages': []}
-
-    rooms[room_id]['users'].add(user)
+    first_connection = add_room_user(room_id, user)
+    publish_state('join', room=room_id, user=user)
 
     # Send room history
     emit('room_history', {
-        'messages': rooms[room_id]['messages'][-50:],  # Last 50 messages
-        'users': list(rooms[room_id]['users'])
+        'messages': rooms[room_id]['messages'].recent_encoded(),
+        'users': list(rooms[room_id]['users']),
+        'last_seq': rooms[room_id]['messages'].last_seq,
     })
 
     # Also send an explicit user_list event to the joining client so
@@ -138,32 +727,33 @@ def handle_join(data):
     except Exception:
         pass
 
-    # Ensure the joining client receives the emote mapping (avoid connect-time races)
+    # Ensure the joining client knows the emote version (avoid connect-time races)
     try:
-        emit('emotes', EMOTE_MAP, room=request.sid)
+        emit('emotes_version', emote_registry.version_info(), room=request.sid)
     except Exception:
         pass
 
-    # Notify others
-    emit('user_joined', {'user': user}, room=room_id, skip_sid=request.sid)
-    emit('joined', {'room': room_id, 'user': user})
+    # Notify others, unless this is just another tab of someone already here
+    if first_connection:
+        emit('user_joined', {'user': user}, room=room_id, skip_sid=request.sid)
+    emit('joined', {'room': room_id, 'user': user, 'resume_token': session.resume_token})
 
-    print(f"User {user} joined room {room_id}")
+    log.info("User %s joined room %s", user, room_id)
 
 @socketio.on('leave')
 def handle_leave():
     session = user_sessions.get(request.sid)
-    if session and session['room'] and session['user']:
-        room_id = session['room']
-        user = session['user']
+    if session and session.room and session.user:
+        room_id = session.room
+        user = session.user
         leave_room(room_id)
-        if room_id in rooms and user in rooms[room_id]['users']:
-            rooms[room_id]['users'].remove(user)
-            emit('user_left', {'user': user}, room=room_id)
-        session['room'] = None
+        leave_room_state(room_id, user)
+        session.room = None
+        session.resume_token = None
         emit('left')
 
 @socketio.on('message')
+@timed('message')
 def handle_message(data):
     user = data.get('user')
     text = data.get('text')
@@ -176,28 +766,19 @@ def handle_message(data):
     # Update session
     session = user_sessions.get(request.sid)
     if session:
-        session['last_seen'] = time.time()
-
-    # Create message
-    message = {
-        'user': user,
-        'text': text,
-        'timestamp': time.time(),
-        'id': f"{user}_{int(time.time() * 1000)}"
-    }
+        session.last_seen = time.time()
 
-    # Store in room history
-    if room_id in rooms:
-        rooms[room_id]['messages'].append(message)
-        # Keep only last 200 messages
-        if len(rooms[room_id]['messages']) > 200:
-            rooms[room_id]['messages'] = rooms[room_id]['messages'][-200:]
+    if not message_allowed(request.sid, room_id):
+        limit_message(request.sid, room_id, user, text)
+        return
 
-    # Broadcast to room
-    emit('message', message, room=room_id)
-    print(f"Message from {user} in {room_id}: {text}")
+    # Store in room history and broadcast to room
+    deliver_message(room_id, build_message(room_id, user, text))
+    message_log.info("Message from %s in %s: %.80s", user, room_id, text,
+                     extra={'room': room_id, 'user': user, 'chars': len(text)})
 
 @socketio.on('bot_message')
+@timed('bot_message')
 def handle_bot_message(data):
     """Handle messages from bots"""
     user = data.get('user')
@@ -207,53 +788,221 @@ def handle_bot_message(data):
     if not user or not text or not room_id:
         return
 
-    # Create message
-    message = {
-        'user': user,
-        'text': text,
-        'timestamp': time.time(),
-        'id': f"bot_{user}_{int(time.time() * 1000)}",
-        'is_bot': True
-    }
-
-    # Store in room history
-    if room_id in rooms:
-        rooms[room_id]['messages'].append(message)
-        if len(rooms[room_id]['messages']) > 200:
-            rooms[room_id]['messages'] = rooms[room_id]['messages'][-200:]
+    if not message_allowed(request.sid, room_id):
+        limit_message(request.sid, room_id, user, text, is_bot=True)
+        return
 
-    # Broadcast to room
-    emit('message', message, room=room_id)
-    print(f"Bot message from {user} in {room_id}: {text}")
+    # Store in room history and broadcast to room
+    deliver_message(room_id, build_message(room_id, user, text, is_bot=True))
+    message_log.info("Bot message from %s in %s: %.80s", user, room_id, text,
+                     extra={'room': room_id, 'user': user, 'chars': len(text), 'bot': True})
 
 @socketio.on('typing')
+@timed('typing')
 def handle_typing(data):
     room_id = data.get('room')
     user = data.get('user')
+    if not sid_typing_limiter.allow(request.sid):
+        return
+    session = user_sessions.get(request.sid)
+    if session:
+        session.last_seen = time.time()
     if room_id and user:
-        emit('typing', {'user': user}, room=room_id, skip_sid=request.sid)
+        typing_tracker.start(room_id, user, time.time())
+        publish_state('typing', room=room_id, user=user, active=True)
 
 @socketio.on('stop_typing')
+@timed('stop_typing')
 def handle_stop_typing(data):
     room_id = data.get('room')
     user = data.get('user')
     if room_id and user:
-        emit('stop_typing', {'user': user}, room=room_id, skip_sid=request.sid)
+        typing_tracker.stop(room_id, user)
+        publish_state('typing', room=room_id, user=user, active=False)
+
+# Older history, paged by message seq
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', 200))
+
+
+def history_page(room_id, before=None, since=None, limit=HISTORY_SNAPSHOT_SIZE):
+    """Messages after ``since``, or else the ones before ``before`` (default:
+    the newest), oldest first. Pages reach past the in-memory window into
+    HISTORY_DB when it is enabled.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    room = rooms.get(room_id)
+    if room is None and history_store is not None:
+        # reaped (or never loaded here): read the database without
+        # recreating the room, so a GET can't conjure rooms up
+        return stored_history_page(room_id, before, since, limit)
+    if room is None:
+        history = RoomHistory(0)
+        history.last_seq = dropped_room_seqs.get(room_id, 0)
+    else:
+        history = room['messages']
+    if since is not None:
+        messages = []
+        if history_store is not None and since + 1 < history.oldest_seq:
+            messages = history_store.page_since(room_id, since, limit)
+        if not messages:
+            messages = history.since(since, limit)
+        has_more = bool(messages) and message_seq(messages[-1]) < history.last_seq
+    else:
+        if before is None:
+            before = history.last_seq + 1
+        messages = history.before(before, limit + 1)
+        if len(messages) <= limit and history_store is not None:
+            older_than = message_seq(messages[0]) if messages else min(before, history.oldest_seq)
+            messages = history_store.page_before(room_id, older_than, limit + 1 - len(messages)) + messages
+        has_more = len(messages) > limit
+        messages = messages[-limit:]
+    return {'room': room_id, 'messages': messages, 'has_more': has_more,
+            'last_seq': history.last_seq}
+
+
+def stored_history_page(room_id, before, since, limit):
+    """history_page() for a room that is only in HISTORY_DB."""
+    last_seq = history_store.last_seq(room_id)
+    if since is not None:
+        messages = history_store.page_since(room_id, since, limit)
+        has_more = bool(messages) and message_seq(messages[-1]) < last_seq
+    else:
+        if before is None:
+            before = last_seq + 1
+        messages = history_store.page_before(room_id, before, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[-limit:]
+    return {'room': room_id, 'messages': messages, 'has_more': has_more,
+            'last_seq': last_seq}
+
+
+def page_args(args):
+    """before/since/limit from a request, as ints (None when absent)."""
+    parsed = {}
+    for key in ('before', 'since', 'limit'):
+        value = args.get(key)
+        if value is not None:
+            parsed[key] = int(value)
+    return parsed
+
+
+@socketio.on('history_before')
+@timed('history_before')
+def handle_history_before(data):
+    try:
+        args = page_args({'before': data.get('seq'), 'limit': data.get('limit')})
+    except (TypeError, ValueError):
+        emit('error', {'message': 'seq and limit must be integers'})
+        return
+    if data.get('room'):
+        emit('history_page', history_page(data['room'], **args))
+
+@socketio.on('history_since')
+@timed('history_since')
+def handle_history_since(data):
+    try:
+        args = page_args({'since': data.get('seq', 0), 'limit': data.get('limit')})
+    except (TypeError, ValueError):
+        emit('error', {'message': 'seq and limit must be integers'})
+        return
+    if data.get('room'):
+        emit('history_page', history_page(data['room'], **args))
+
+@app.route('/rooms/<room_id>/messages')
+def room_messages(room_id):
+    try:
+        args = page_args(request.args)
+    except ValueError:
+        abort(400)
+    return app.response_class(dumps(history_page(room_id, **args)), mimetype='application/json')
 
 @socketio.on('ping')
 def handle_ping():
     """Keep-alive ping"""
     session = user_sessions.get(request.sid)
     if session:
-        session['last_seen'] = time.time()
+        session.last_seen = time.time()
     emit('pong')
 
 # Health check endpoint
 @app.route('/health')
 def health():
-    return {'status': 'healthy', 'rooms': len(rooms), 'sessions': len(user_sessions)}
+    return {
+        'status': 'healthy',
+        'rooms': len(rooms),
+        'sessions': len(user_sessions),
+        'async_mode': socketio.async_mode,
+        'json_encoder': ENCODER_NAME,
+        'emotes_version': emote_registry.current.version,
+        'emote_assets': len(emote_assets.assets) if emote_assets else None,
+        'rate_limits': {
+            'mode': RATE_LIMIT_MODE,
+            'sid_message': sid_message_limiter.stats(),
+            'room_message': room_message_limiter.stats(),
+            'sid_typing': sid_typing_limiter.stats(),
+            'pending_coalesced': len(coalesced_messages),
+            **rate_limit_counters,
+        },
+        'cluster': cluster_manager.host_id if cluster_manager else None,
+        'max_connections': MAX_CONNECTIONS,
+    }
+
+
+# Scrape-time gauges; everything here is read from existing state
+metrics.gauge('rooms', 'Rooms known to this worker', lambda: len(rooms))
+metrics.gauge('sessions', 'Connected sockets on this worker', lambda: len(user_sessions))
+metrics.gauge('room_users', 'Users present per room',
+              lambda: {(room_id, ): len(room['users']) for room_id, room in rooms.items()},
+              labels=('room',))
+metrics.gauge('room_history_messages', 'Messages held in each room history',
+              lambda: {(room_id, ): len(room['messages']) for room_id, room in rooms.items()},
+              labels=('room',))
+metrics.gauge('emote_map_bytes', 'Size of the /emotes.json body',
+              lambda: {('identity', ): len(emote_registry.current.body),
+                       ('gzip', ): len(emote_registry.current.gzip_body)},
+              labels=('encoding',))
+metrics.gauge('emote_map_entries', 'Emotes in the current map',
+              lambda: len(emote_registry.current.emotes))
+metrics.gauge('emote_asset_bytes', 'Bytes of indexed emote images',
+              lambda: emote_assets.total_bytes() if emote_assets else None)
+metrics.gauge('history_pending_writes', 'Messages queued for the history database',
+              lambda: len(history_store.pending) if history_store else None)
+metrics.gauge('history_written_messages', 'Messages written to the history database since start',
+              lambda: history_store.written if history_store else None)
+metrics.gauge('parked_sessions', 'Dropped sockets waiting to resume',
+              lambda: len(resume_registry.parked))
+metrics.gauge('rate_limited_events', 'Events refused by each rate limiter since start',
+              lambda: {('sid_message', ): sid_message_limiter.limited,
+                       ('room_message', ): room_message_limiter.limited,
+                       ('sid_typing', ): sid_typing_limiter.limited},
+              labels=('limiter',))
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype=None,
+                              content_type=METRICS_CONTENT_TYPE)
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    print(f"Starting server on port {port}")
-    socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    log.info("Starting server on port %d (async_mode=%s, max_connections=%s)",
+             port, socketio.async_mode, MAX_CONNECTIONS)
+    start_cluster()
+    if EMOTES_POLL_INTERVAL > 0:
+        socketio.start_background_task(watch_emotes)
+    if RATE_LIMIT_MODE == 'coalesce':
+        socketio.start_background_task(flush_coalesced_messages)
+    socketio.start_background_task(broadcast_typing)
+    if resume_registry.enabled:
+        socketio.start_background_task(expire_resume_tokens)
+    if SESSION_IDLE_TIMEOUT > 0 or EMPTY_ROOM_TTL > 0:
+        socketio.start_background_task(reap_presence)
+    if history_store is not None:
+        socketio.start_background_task(persist_history)
+        atexit.register(history_store.close)
+        signal.signal(signal.SIGTERM, exit_on_sigterm)
+    run_options = {}
+    if socketio.async_mode == 'threading':
+        # Werkzeug refuses to start outside a tty unless explicitly allowed
+        run_options['allow_unsafe_werkzeug'] = True
+    socketio.run(app, host='0.0.0.0', port=port, debug=False, **run_options)
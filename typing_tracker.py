@@ -0,0 +1,38 @@
+"""Server-side typing indicator state for server.py.
+
+Instead of relaying every keystroke-driven ``typing``/``stop_typing`` event to
+the whole room, the server records who is typing and broadcasts one
+``typing_users`` list per room at a fixed cadence, and only when it changed.
+Entries expire on their own if a client never sends ``stop_typing``.
+"""
+
+
+class TypingTracker:
+    def __init__(self, ttl=3.0):
+        self.ttl = ttl
+        self.rooms = {}  # room_id -> {user: expires_at}
+        self.last_sent = {}  # room_id -> tuple of users last broadcast
+
+    def start(self, room_id, user, now):
+        self.rooms.setdefault(room_id, {})[user] = now + self.ttl
+
+    def stop(self, room_id, user):
+        typers = self.rooms.get(room_id)
+        if typers:
+            typers.pop(user, None)
+
+    def changes(self, now):
+        """Yield ``(room_id, users)`` for rooms whose typing set changed."""
+        for room_id in list(self.rooms.keys() | self.last_sent.keys()):
+            typers = self.rooms.get(room_id, {})
+            for user in [u for u, expires in typers.items() if expires <= now]:
+                del typers[user]
+            users = tuple(sorted(typers))
+            if not typers:
+                self.rooms.pop(room_id, None)
+            if users != self.last_sent.get(room_id, ()):
+                if users:
+                    self.last_sent[room_id] = users
+                else:
+                    self.last_sent.pop(room_id, None)
+                yield room_id, users